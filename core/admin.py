@@ -1,6 +1,91 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Book, Transaction, Fee
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db import models
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .models import User, Book, Transaction, TransactionArchive, Fee
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large changelists. On PostgreSQL an unfiltered list
+    uses the planner's row estimate (pg_class.reltuples); a filtered list is
+    counted exactly up to ADMIN_EXACT_COUNT_LIMIT rows and estimated with
+    EXPLAIN beyond that. Other backends fall back to an exact COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > limit:
+                return row[0]
+
+        exact = queryset.order_by().values('pk')[:limit + 1].count()
+        if exact <= limit:
+            return exact
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(exact, int(plan[0]['Plan']['Plan Rows']))
+
+class RecentDateFieldListFilter(admin.DateFieldListFilter):
+    """Date filter limited to Any date / Today / Past 7 days / This month, which index range scans can serve."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.links = self.links[:4] # Drops "This year" and the "No date" / "Has date" scans
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for multi-million-row tables: estimated page counts,
+    no second full-table COUNT(*), and search by exact match on the indexed
+    columns listed in `search_fields` (e.g. an ISBN, a username or a UUID)
+    instead of icontains across joins.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        query = Q()
+        for field_path in self.get_search_fields(request):
+            field = self._resolve_search_field(field_path)
+            try:
+                value = field.to_python(search_term)
+            except ValidationError:
+                continue # e.g. a username typed into a UUID column
+            if isinstance(field, models.CharField) and len(value) > field.max_length:
+                continue
+            query |= Q(**{field_path: value})
+        return (queryset.filter(query) if query else queryset.none()), False
+
+    def _resolve_search_field(self, field_path):
+        opts = self.model._meta
+        field = None
+        for part in field_path.split('__'):
+            field = opts.get_field(opts.pk.name if part == 'pk' else part)
+            if field.is_relation:
+                opts = field.related_model._meta
+        return field
 
 # Custom UserAdmin to display user_type and other fields
 class UserAdmin(BaseUserAdmin):
@@ -19,21 +104,45 @@ class BookAdmin(admin.ModelAdmin):
     list_filter = ('status', 'category', 'language')
     readonly_fields = ('created_at', 'updated_at', 'id')
 
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'book', 'transaction_type', 'transaction_date', 'due_date', 'return_date')
-    search_fields = ('user__username', 'book__title', 'book__isbn')
-    list_filter = ('transaction_type', 'transaction_date', 'due_date', 'return_date')
+    list_select_related = ('user', 'book')
+    search_fields = ('id', 'user__username', 'book__isbn') # Exact matches on indexed columns, see LargeTableAdminMixin
+    list_filter = (
+        'transaction_type',
+        ('transaction_date', RecentDateFieldListFilter),
+        ('due_date', RecentDateFieldListFilter),
+        ('return_date', RecentDateFieldListFilter),
+    )
+    ordering = ('-transaction_date',)
     autocomplete_fields = ['user', 'book'] # For easier selection in admin
     readonly_fields = ('id',)
 
-class FeeAdmin(admin.ModelAdmin):
+class TransactionArchiveAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'book', 'transaction_type', 'transaction_date', 'return_date', 'archived_at')
+    list_select_related = ('user', 'book')
+    search_fields = ('id', 'user__username', 'book__isbn')
+    readonly_fields = ('id', 'user', 'book', 'transaction_type', 'transaction_date', 'due_date', 'return_date', 'archived_at')
+
+    def has_add_permission(self, request): # Rows only arrive through the archival job
+        return False
+
+class FeeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'book', 'fee_type', 'amount', 'paid_status', 'payment_date', 'created_at')
-    search_fields = ('user__username', 'book__title', 'transaction__id')
-    list_filter = ('paid_status', 'fee_type', 'created_at', 'payment_date')
+    list_select_related = ('user', 'book')
+    search_fields = ('id', 'user__username', 'book__isbn', 'transaction')
+    list_filter = (
+        'paid_status',
+        'fee_type',
+        ('created_at', RecentDateFieldListFilter),
+        ('payment_date', RecentDateFieldListFilter),
+    )
+    ordering = ('-created_at',)
     autocomplete_fields = ['user', 'book', 'transaction']
     readonly_fields = ('id', 'created_at', 'updated_at')
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Book, BookAdmin)
 admin.site.register(Transaction, TransactionAdmin)
+admin.site.register(TransactionArchive, TransactionArchiveAdmin)
 admin.site.register(Fee, FeeAdmin)
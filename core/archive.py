@@ -0,0 +1,102 @@
+"""
+Archival of completed transactions.
+
+Returned loans older than TRANSACTION_ARCHIVE_AFTER_DAYS are moved from
+`Transaction` into `TransactionArchive` in bounded batches, so the live table
+only carries open loans and recent history. Fees pointing at an archived
+transaction are re-pointed to the archive row in the same batch.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Transaction, TransactionArchive, Fee
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'book_id', 'transaction_type', 'transaction_date', 'due_date', 'return_date']
+
+
+def archive_after_days():
+    return getattr(settings, 'TRANSACTION_ARCHIVE_AFTER_DAYS', 365)
+
+
+def archive_cutoff(now=None):
+    """Transactions returned before this moment are eligible for archival."""
+    return (now or timezone.now()) - timedelta(days=archive_after_days())
+
+
+def archivable_transactions(cutoff):
+    return Transaction.objects.filter(return_date__isnull=False, return_date__lt=cutoff)
+
+
+def ensure_month_partition(month_start):
+    """
+    Create the monthly partition of core_transactionarchive covering `month_start`
+    if it does not exist yet. No-op on backends without declarative partitioning.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    month_start = month_start.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    table = TransactionArchive._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_y{month_start:%Y}m{month_start:%m} "
+            f"PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            [month_start.isoformat(), next_month.isoformat()],
+        )
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move up to `batch_size` completed transactions into the archive.
+    Returns the number of rows archived (0 once nothing is left).
+    """
+    with db_transaction.atomic():
+        rows = list(
+            archivable_transactions(cutoff)
+            .order_by('return_date')
+            .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        months = {date(row['transaction_date'].year, row['transaction_date'].month, 1) for row in rows}
+        for month_start in sorted(months):
+            ensure_month_partition(month_start)
+
+        now = timezone.now()
+        TransactionArchive.objects.bulk_create(
+            [TransactionArchive(archived_at=now, **row) for row in rows]
+        )
+        ids = [row['id'] for row in rows]
+        # Archive rows keep the transaction's id, so the fee reference can be moved with one UPDATE.
+        Fee.objects.filter(transaction_id__in=ids).update(
+            archived_transaction_id=F('transaction_id'), transaction_id=None
+        )
+        Transaction.objects.filter(id__in=ids).delete()
+    return len(rows)
+
+
+def archive_transactions(cutoff=None, batch_size=None, max_batches=None, progress=None):
+    """
+    Archive every eligible transaction, one short DB transaction per batch so
+    locks are held briefly and the job can be interrupted safely.
+    Returns the total number of rows archived.
+    """
+    cutoff = cutoff or archive_cutoff()
+    batch_size = batch_size or getattr(settings, 'TRANSACTION_ARCHIVE_BATCH_SIZE', 1000)
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        total += moved
+        batches += 1
+        if progress:
+            progress(total)
+    return total
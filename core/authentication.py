@@ -0,0 +1,14 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .revocation import is_revoked
+
+
+class RevocationCheckingJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that also rejects tokens revoked by logout or revoke-all (see core/revocation.py)."""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token.payload):
+            raise InvalidToken({'detail': 'Token has been revoked.', 'code': 'token_revoked'})
+        return token
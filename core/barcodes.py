@@ -0,0 +1,156 @@
+"""
+Barcode labels for book spines and patron cards.
+
+Images are rendered with python-barcode and kept in a content-addressed disk
+cache under BARCODE_CACHE_DIR. The address is a hash of everything that
+affects the output (symbology, value, format, writer options, library
+version), so it doubles as the ETag. A repeat request, or a label on a
+reprinted sheet, is a file read, or a 304 without touching the disk. The
+cache can be deleted at any time.
+
+Books with a valid 13-digit ISBN get an EAN-13 (ISBN) barcode; everything
+else, including patron cards (which encode the username), uses Code 128.
+Code 128 only covers ASCII, so values it cannot encode (e.g. the username
+"josé") raise BarcodeValueUnsupported; sheets print such labels with a note
+instead of a barcode. SVG needs no extra packages; PNG needs Pillow.
+"""
+import base64
+import hashlib
+import importlib.metadata
+import json
+import os
+import tempfile
+from html import escape
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+
+FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+WRITER_OPTIONS = {'module_height': 12.0, 'font_size': 8, 'text_distance': 4.0, 'quiet_zone': 4.0}
+LIBRARY_VERSION = importlib.metadata.version('python-barcode')
+
+
+class BarcodeFormatUnavailable(Exception):
+    pass
+
+
+class BarcodeValueUnsupported(Exception):
+    pass
+
+
+def cache_dir():
+    return Path(getattr(settings, 'BARCODE_CACHE_DIR', Path(tempfile.gettempdir()) / 'library-barcodes'))
+
+
+def is_isbn13(value):
+    if len(value) != 13 or not value.isdigit() or not value.startswith(('978', '979')):
+        return False
+    checksum = sum(int(digit) * (1 if i % 2 == 0 else 3) for i, digit in enumerate(value[:12]))
+    return (10 - checksum % 10) % 10 == int(value[12])
+
+
+def book_symbology(book):
+    return ('isbn13', book.isbn) if is_isbn13(book.isbn) else ('code128', book.isbn)
+
+
+def user_symbology(user):
+    return ('code128', user.username)
+
+
+def barcode_key(symbology, value, fmt):
+    spec = json.dumps([symbology, value, fmt, WRITER_OPTIONS, LIBRARY_VERSION], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+
+def etag_for(key):
+    return f'"{key[:32]}"'
+
+
+def _writer(fmt):
+    if fmt == 'svg':
+        from barcode.writer import SVGWriter
+        return SVGWriter()
+    from barcode.writer import ImageWriter
+    if ImageWriter is None: # python-barcode leaves it unset when Pillow is missing
+        raise BarcodeFormatUnavailable("PNG barcodes need Pillow; install it or request SVG.")
+    return ImageWriter(format='PNG')
+
+
+def render(symbology, value, fmt):
+    from barcode import get_barcode_class
+    from barcode.errors import BarcodeError
+
+    buffer = BytesIO()
+    try:
+        code = get_barcode_class(symbology)(value, writer=_writer(fmt))
+    except BarcodeError as e: # e.g. IllegalCharacterError for non-ASCII Code 128 values
+        raise BarcodeValueUnsupported(f"{value!r} cannot be encoded as {symbology}: {e}") from None
+    code.write(buffer, dict(WRITER_OPTIONS))
+    return buffer.getvalue()
+
+
+def _path(key, suffix):
+    return cache_dir() / key[:2] / f"{key}.{suffix}"
+
+
+def _cached(key, suffix, produce):
+    """Content of the cache entry `key`, calling `produce()` and storing the result on a miss."""
+    path = _path(key, suffix)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    content = produce()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename, so concurrent workers never read a partial image.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp, path)
+    return content
+
+
+def get_barcode(symbology, value, fmt='svg'):
+    """Returns (content, etag) for one barcode image, rendering it only on a cache miss."""
+    key = barcode_key(symbology, value, fmt)
+    return _cached(key, fmt, lambda: render(symbology, value, fmt)), etag_for(key)
+
+
+def sheet_key(labels):
+    return hashlib.sha256(json.dumps(labels, sort_keys=True).encode()).hexdigest()
+
+
+def get_sheet(labels, title='Labels'):
+    """
+    Returns (html, etag) for a printable sheet. `labels` is a list of
+    (symbology, value, caption). The sheet is cached as a whole, and each
+    barcode on it comes from the per-image cache.
+    """
+    labels = [[symbology, value, caption] for symbology, value, caption in labels]
+    key = sheet_key([title, WRITER_OPTIONS, LIBRARY_VERSION, labels])
+
+    def produce():
+        cells = []
+        for symbology, value, caption in labels:
+            try:
+                svg, _ = get_barcode(symbology, value, 'svg')
+            except BarcodeValueUnsupported: # Flag it and print the rest of the sheet
+                image = f'<div class="unsupported">{escape(value)}: cannot be encoded as a barcode</div>'
+            else:
+                image = f'<img alt="{escape(value)}" src="data:image/svg+xml;base64,{base64.b64encode(svg).decode()}">'
+            cells.append(f'<div class="label">{image}<div class="caption">{escape(caption)}</div></div>')
+        return (
+            f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{escape(title)}</title><style>'
+            '@page { size: A4; margin: 10mm; } body { margin: 0; font-family: sans-serif; }'
+            '.sheet { display: grid; grid-template-columns: repeat(3, 1fr); gap: 4mm; }'
+            '.label { break-inside: avoid; text-align: center; border: 1px dashed #ccc; padding: 2mm; }'
+            '.label img { max-width: 100%; } .caption { font-size: 8pt; overflow: hidden; white-space: nowrap; text-overflow: ellipsis; }'
+            '.unsupported { padding: 6mm 0; font-size: 8pt; color: #a00; }'
+            f'</style></head><body><div class="sheet">{"".join(cells)}</div></body></html>'
+        ).encode()
+
+    return _cached(key, 'html', produce), etag_for(key)
@@ -0,0 +1,137 @@
+"""
+Consistency checks between Book.status, open loans and overdue fees.
+
+Checkout and return write the loan and the book status separately, so the
+two can drift. Each check below is one set-based query: an anti-join or
+semi-join via EXISTS, or a GROUP BY. Counting and sampling never load more
+than the sample. Repairs walk the offending rows in primary-key order, in
+batches (keyset pagination), and re-apply the check inside each UPDATE or
+INSERT. That keeps memory bounded, keeps transactions short on large tables,
+and leaves rows alone if a concurrent checkout or return has already fixed
+them.
+"""
+from django.conf import settings
+from django.db.models import Count, Exists, F, OuterRef
+
+from .facets import bump_catalog_version
+from .models import Book, Transaction, Fee
+
+
+def open_loans():
+    return Transaction.objects.filter(transaction_type='checkout', return_date__isnull=True)
+
+
+def borrowed_without_open_loan():
+    return Book.objects.filter(status='borrowed').filter(~Exists(open_loans().filter(book=OuterRef('pk'))))
+
+
+def available_with_open_loan():
+    return Book.objects.filter(status='available').filter(Exists(open_loans().filter(book=OuterRef('pk'))))
+
+
+def books_with_several_open_loans():
+    return open_loans().order_by().values('book_id').annotate(open_loans=Count('id')).filter(open_loans__gt=1)
+
+
+def late_returns_without_fee():
+    return (
+        Transaction.objects
+        .filter(return_date__isnull=False, due_date__isnull=False, due_date__lt=F('return_date__date'))
+        .filter(~Exists(Fee.objects.filter(transaction=OuterRef('pk'))))
+    )
+
+
+def _pk_batches(queryset, batch_size):
+    """Yields lists of primary keys from `queryset`, in pk order, `batch_size` at a time."""
+    last = None
+    while True:
+        page = queryset.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        pks = list(page.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+        last = pks[-1]
+
+
+def _set_book_status(check, new_status, batch_size):
+    repaired = 0
+    for pks in _pk_batches(check(), batch_size):
+        # update() skips signals: update_changed() stamps the change feed, and the facet cache is bumped below.
+        repaired += check().filter(pk__in=pks).update_changed(status=new_status)
+    if repaired:
+        bump_catalog_version()
+    return repaired
+
+
+def repair_borrowed_without_open_loan(batch_size):
+    return _set_book_status(borrowed_without_open_loan, 'available', batch_size)
+
+
+def repair_available_with_open_loan(batch_size):
+    return _set_book_status(available_with_open_loan, 'borrowed', batch_size)
+
+
+def repair_late_returns_without_fee(batch_size):
+    created = 0
+    for pks in _pk_batches(late_returns_without_fee(), batch_size):
+        fees = []
+        for loan in late_returns_without_fee().filter(pk__in=pks).values('id', 'user_id', 'book_id', 'due_date', 'return_date'):
+            overdue_days = (loan['return_date'].date() - loan['due_date']).days
+            fees.append(Fee(
+                user_id=loan['user_id'], book_id=loan['book_id'], transaction_id=loan['id'], fee_type='overdue',
+                amount=Fee.overdue_amount(overdue_days),
+                notes=f"Overdue by {overdue_days} day(s). Added by the consistency check.",
+            ))
+        # A fee created by a concurrent return in the meantime wins: Fee.transaction is unique.
+        Fee.objects.bulk_create(fees, ignore_conflicts=True)
+        # Skipped rows are not reported back, but fee ids are generated here, so count the ones that exist.
+        created += Fee.objects.filter(pk__in=[fee.pk for fee in fees]).count()
+    return created
+
+
+# name: (description, queryset of offending rows, field identifying a row in samples, bulk repair or None)
+CHECKS = {
+    'borrowed_without_open_loan': (
+        "Books marked borrowed with no open checkout (repair: mark available)",
+        borrowed_without_open_loan, 'isbn', repair_borrowed_without_open_loan,
+    ),
+    'available_with_open_loan': (
+        "Books marked available with an open checkout (repair: mark borrowed)",
+        available_with_open_loan, 'isbn', repair_available_with_open_loan,
+    ),
+    'several_open_loans': (
+        "Books with more than one open checkout (no automatic repair; return the extra loans)",
+        books_with_several_open_loans, 'book_id', None,
+    ),
+    'late_return_without_fee': (
+        "Loans returned after their due date without an overdue fee (repair: create the fee)",
+        late_returns_without_fee, 'id', repair_late_returns_without_fee,
+    ),
+}
+
+
+def find_inconsistencies(names=None, sample_size=None):
+    """Returns {name: {'description', 'count', 'sample'}} for the selected checks (all by default)."""
+    sample_size = sample_size or getattr(settings, 'CONSISTENCY_SAMPLE_SIZE', 20)
+    report = {}
+    for name in names or CHECKS:
+        description, check, sample_field, _ = CHECKS[name]
+        queryset = check()
+        report[name] = {
+            'description': description,
+            'count': queryset.count(),
+            'sample': list(queryset.order_by(sample_field).values_list(sample_field, flat=True)[:sample_size]),
+        }
+    return report
+
+
+def repair_inconsistencies(names=None, batch_size=None):
+    """Runs the bulk repair of the selected checks that have one. Returns {name: rows repaired}."""
+    batch_size = batch_size or getattr(settings, 'CONSISTENCY_REPAIR_BATCH_SIZE', 1000)
+    return {
+        name: CHECKS[name][3](batch_size)
+        for name in names or CHECKS
+        if CHECKS[name][3] is not None
+    }
@@ -0,0 +1,326 @@
+"""
+Local cover-image cache.
+
+A cover is ingested from a URL (usually `Book.cover_image_url`) or an
+upload. The original is stored in Django's default storage under
+covers/<sha256>/, and thumbnails in the BOOK_COVER_SIZES sizes are written
+next to it. Fetching and resizing run on a small thread pool
+(BOOK_COVER_WORKERS; 0 runs jobs inline) once the surrounding transaction
+commits, so requests never wait for a remote host or for Pillow.
+
+Files are content-addressed, so the URLs given out by `cover_urls` include the
+checksum and can be cached by clients for a year. When a cover becomes ready,
+the book is marked changed (`update_changed`) so synced clients pick up the new URLs.
+
+The fetcher is pluggable: BOOK_COVER_FETCHER is the dotted path of a callable
+`fetch(url) -> (bytes, content_type)`. The default uses urllib and only
+connects to public addresses (redirects included), so a cover URL cannot be
+used to reach hosts on the library's own network. Originals are served with
+the MIME type of the format Pillow detects, not the one the client or remote
+host declared.
+"""
+import hashlib
+import http.client
+import ipaddress
+import socket
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction as db_transaction
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Book, BookCover
+
+THUMBNAIL_FORMAT = 'JPEG'
+THUMBNAIL_CONTENT_TYPE = 'image/jpeg'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class CoverError(ValueError):
+    pass
+
+
+def cover_sizes():
+    return getattr(settings, 'BOOK_COVER_SIZES', {'small': 96, 'medium': 320})
+
+
+def max_bytes():
+    return getattr(settings, 'BOOK_COVER_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def _check_address(host, address):
+    address = ipaddress.ip_address(address.split('%')[0]) # Drop an IPv6 scope id
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    if not address.is_global or address.is_multicast:
+        raise CoverError(f"{host} is not a public address ({address}).")
+
+
+def _connect_public(address, timeout, source_address=None):
+    """socket.create_connection, refusing hosts that resolve to private, loopback, link-local, ... addresses."""
+    host, port = address
+    resolved = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    for ip in resolved: # All of them, so a mixed answer cannot slip a private address through
+        _check_address(host, ip)
+    error = None
+    for ip in resolved: # Connect to the addresses just checked, not to a second lookup
+        try:
+            return socket.create_connection((ip, port), timeout, source_address)
+        except OSError as exc:
+            error = exc
+    raise error
+
+
+# http.client opens its socket through self._create_connection (socket.create_connection by default).
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _CoverRedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = 3 # Each hop goes through the handlers above, so it is checked too
+
+
+def _opener():
+    """HTTP(S) only: no proxies (they would connect for us), no ftp:/file:/data: URLs."""
+    director = urllib.request.OpenerDirector()
+    for handler in [
+        _PublicHTTPHandler(), _PublicHTTPSHandler(), _CoverRedirectHandler(), urllib.request.UnknownHandler(),
+        urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor(),
+    ]:
+        director.add_handler(handler)
+    return director
+
+
+def fetch_url(url):
+    """Default fetcher: HTTP(S) GET of public hosts only, size-capped."""
+    request = urllib.request.Request(url, headers={'User-Agent': 'library-system cover cache'})
+    with _opener().open(request, timeout=getattr(settings, 'BOOK_COVER_FETCH_TIMEOUT', 10)) as response:
+        content = response.read(max_bytes() + 1)
+        return content, response.headers.get_content_type()
+
+
+def get_fetcher():
+    return import_string(getattr(settings, 'BOOK_COVER_FETCHER', 'core.covers.fetch_url'))
+
+
+def original_path(checksum):
+    return f"covers/{checksum[:2]}/{checksum}/original"
+
+
+def thumbnail_path(checksum, size):
+    return f"covers/{checksum[:2]}/{checksum}/{size}.jpg"
+
+
+def _store(path, content):
+    if not default_storage.exists(path): # Same name, same bytes: nothing to do
+        default_storage.save(path, ContentFile(content))
+
+
+def image_type(content):
+    """MIME type of the image format Pillow detects in `content` (reads the header only)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise CoverError("Cover images need Pillow.") from None
+    try:
+        with Image.open(BytesIO(content)) as image:
+            return Image.MIME.get(image.format, 'application/octet-stream')
+    except (OSError, Image.DecompressionBombError) as exc: # UnidentifiedImageError is an OSError
+        raise CoverError(f"The cover is not a readable image ({exc}).") from None
+
+
+def store_original(cover, content, content_type):
+    """`content_type` is what the client or remote host declared; the stored type is the detected one."""
+    if not content:
+        raise CoverError("The cover image is empty.")
+    if len(content) > max_bytes():
+        raise CoverError(f"The cover image is larger than {max_bytes()} bytes.")
+    if content_type and not content_type.startswith('image/'):
+        raise CoverError(f"Expected an image, got {content_type}.")
+    cover.content_type = image_type(content)
+    cover.checksum = hashlib.sha256(content).hexdigest()
+    _store(original_path(cover.checksum), content)
+
+
+def make_thumbnails(cover):
+    from PIL import Image, ImageOps
+
+    with default_storage.open(original_path(cover.checksum)) as original, Image.open(original) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, pixels in cover_sizes().items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((pixels, pixels), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=85, optimize=True, progressive=True)
+            _store(thumbnail_path(cover.checksum, size), buffer.getvalue())
+
+
+def process_cover(book_id):
+    """
+    Worker job: fetch the original if needed, then write the thumbnails.
+    Returns the finished cover, or None if there was nothing to do or the
+    cover was replaced while the job ran (the job queued for the
+    replacement handles it).
+    """
+    cover = BookCover.objects.filter(book_id=book_id, status='pending').first()
+    if cover is None:
+        return None
+    started_from = {'source_url': cover.source_url, 'checksum': cover.checksum}
+    try:
+        if not cover.checksum:
+            content, content_type = get_fetcher()(cover.source_url)
+            store_original(cover, content, content_type)
+        make_thumbnails(cover)
+    except Exception as exc: # Bad URL, host down, not an image, Pillow missing, ...
+        cover.status, cover.error = 'failed', f"{type(exc).__name__}: {exc}"
+    else:
+        cover.status, cover.error = 'ready', ''
+    # Conditional update: never write back over a cover that ingest_url/ingest_upload replaced meanwhile.
+    finished = BookCover.objects.filter(book_id=book_id, status='pending', **started_from).update(
+        checksum=cover.checksum, content_type=cover.content_type, status=cover.status, error=cover.error,
+        updated_at=timezone.now(),
+    )
+    if not finished:
+        return None
+    if cover.status == 'ready':
+        Book.objects.filter(pk=book_id).update_changed() # Thumbnail URLs changed; see the change feed
+    return cover
+
+
+def run_in_worker(book_id):
+    try:
+        return process_cover(book_id)
+    finally:
+        connections.close_all() # Worker threads hold their own connections
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, getattr(settings, 'BOOK_COVER_WORKERS', 4)), thread_name_prefix='covers')
+        return _executor
+
+
+def schedule(book_id):
+    """Queue `process_cover` for after the current transaction commits."""
+    def submit():
+        if getattr(settings, 'BOOK_COVER_WORKERS', 4) <= 0:
+            process_cover(book_id)
+        else:
+            executor().submit(run_in_worker, book_id)
+    db_transaction.on_commit(submit)
+
+
+def check_url(url):
+    """Early check without network access; fetch_url checks the addresses the host resolves to."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise CoverError("Only http and https cover URLs are supported.")
+    if not parts.hostname or parts.hostname == 'localhost' or parts.hostname.endswith('.localhost'):
+        raise CoverError("Cover URLs must name a public host.")
+    try:
+        address = ipaddress.ip_address(parts.hostname)
+    except ValueError:
+        return # A host name: the addresses it resolves to are checked when it is fetched
+    _check_address(parts.hostname, str(address))
+
+
+def ingest_url(book, url, queue=True):
+    """Queue fetching the cover at `url` (no network access in the request). With queue=False the caller runs the job."""
+    check_url(url)
+    BookCover.objects.update_or_create(book=book, defaults={
+        'source_url': url, 'cover_image_url': book.cover_image_url or '', 'checksum': '', 'content_type': '',
+        'status': 'pending', 'error': '',
+    })
+    if queue:
+        schedule(book.pk)
+
+
+def replace_url(book, url):
+    """Point the book at a new cover URL and queue fetching it, so later saves of the book keep it."""
+    check_url(url)
+    with db_transaction.atomic():
+        book.cover_image_url = url
+        Book.objects.filter(pk=book.pk).update_changed(cover_image_url=url)
+        ingest_url(book, url)
+
+
+def ingest_upload(book, upload):
+    """Store an uploaded cover now and queue its thumbnails."""
+    cover = BookCover.objects.filter(book=book).first() or BookCover(book=book)
+    store_original(cover, upload.read(max_bytes() + 1), upload.content_type)
+    cover.source_url, cover.status, cover.error = '', 'pending', ''
+    cover.cover_image_url = book.cover_image_url or '' # Kept until the book gets a different URL
+    cover.save()
+    schedule(book.pk)
+
+
+def needs_ingest(book):
+    """True if the book's cover_image_url is new: no cover yet, or the cover was set for another URL."""
+    if not book.cover_image_url:
+        return False
+    cover = BookCover.objects.filter(book=book).only('cover_image_url').first()
+    return cover is None or cover.cover_image_url != book.cover_image_url
+
+
+def uncached_books(retry_failed=False):
+    """Books with a cover URL but no cover row (or, with `retry_failed`, a failed one): an anti-join."""
+    covered = BookCover.objects.filter(book=OuterRef('pk'))
+    if retry_failed:
+        covered = covered.exclude(status='failed')
+    return Book.objects.exclude(cover_image_url__isnull=True).exclude(cover_image_url='').filter(~Exists(covered))
+
+
+def stale_covers():
+    """
+    Covers left 'pending' for longer than BOOK_COVER_STALE_MINUTES: their job
+    was lost (process restarted, worker crashed) and nothing else re-queues it.
+    """
+    cutoff = timezone.now() - timedelta(minutes=getattr(settings, 'BOOK_COVER_STALE_MINUTES', 30))
+    return BookCover.objects.filter(status='pending', updated_at__lt=cutoff)
+
+
+def cover_urls(book, request=None):
+    """{size: url} of the book's thumbnails (plus 'original'), or None if there is no ready cover."""
+    try:
+        cover = book.cover
+    except BookCover.DoesNotExist:
+        return None
+    if cover.status != 'ready':
+        return None
+    path = reverse('book-cover', args=[book.pk])
+    urls = {size: f"{path}?size={size}&v={cover.checksum[:16]}" for size in [*cover_sizes(), 'original']}
+    if request is not None:
+        urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+    return urls
@@ -0,0 +1,102 @@
+"""
+Facet counts for the book catalog (category, status, language, publisher).
+
+Counts are computed against the already-filtered queryset with one grouped
+query per facet, or a single GROUPING SETS query on PostgreSQL. Results are
+cached under the normalized filter set plus a catalog version number that is
+bumped whenever a book is saved or deleted.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# Query parameters that do not change which books match, so they are left out of the cache key.
+NON_FILTER_PARAMS = {'page', 'page_size', 'ordering', 'fields', 'exclude', 'facets'}
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def bump_catalog_version():
+    """Invalidate every cached facet block (old keys simply expire)."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError: # Key missing or evicted
+        cache.set(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def facet_cache_key(scope, query_params):
+    normalized = sorted(
+        (key, sorted(values)) for key, values in query_params.lists() if key not in NON_FILTER_PARAMS
+    )
+    digest = hashlib.sha1(repr((scope, normalized)).encode()).hexdigest()
+    return f"catalog:facets:{catalog_version()}:{digest}"
+
+
+def _grouped_counts(queryset, fields, limit):
+    facets = {}
+    for field in fields:
+        rows = queryset.order_by().values(field).annotate(count=Count('pk')).order_by('-count', field)[:limit]
+        facets[field] = [(row[field], row['count']) for row in rows]
+    return facets
+
+
+def _grouping_sets_counts(queryset, fields, limit):
+    """
+    All facets in one scan: GROUPING SETS gives one set of groups per field,
+    and a window over GROUPING() ranks the values within each set so only
+    the top `limit` rows per facet leave the database. Ties break on the
+    value, as in `_grouped_counts`.
+    """
+    sql, params = queryset.order_by().values(*fields).query.sql_with_params()
+    columns = [connection.ops.quote_name(field) for field in fields]
+    grouped_value = f"COALESCE({', '.join(f'{c}::text' for c in columns)})" # The only column not rolled up
+    query = (
+        f"SELECT * FROM ("
+        f"SELECT {', '.join(columns)}, {', '.join(f'GROUPING({c})' for c in columns)}, COUNT(*), "
+        f"ROW_NUMBER() OVER (PARTITION BY GROUPING({', '.join(columns)}) "
+        f"ORDER BY COUNT(*) DESC, {grouped_value} ASC NULLS FIRST) AS facet_rank "
+        f"FROM ({sql}) AS facet_source "
+        f"GROUP BY GROUPING SETS ({', '.join(f'({c})' for c in columns)})"
+        f") AS ranked WHERE facet_rank <= %s ORDER BY facet_rank"
+    )
+    facets = {field: [] for field in fields}
+    with connection.cursor() as cursor:
+        cursor.execute(query, (*params, limit))
+        for row in cursor.fetchall():
+            values, grouping, count = row[:len(fields)], row[len(fields):-2], row[-2]
+            for field, value, rolled_up in zip(fields, values, grouping):
+                if not rolled_up:
+                    facets[field].append((value, count))
+    return facets
+
+
+def compute_facets(queryset, fields):
+    """
+    Returns {field: [{'value': ..., 'count': n}, ...]} for `queryset`, most
+    common values first, capped at BOOK_FACET_LIMIT values per facet.
+    """
+    limit = getattr(settings, 'BOOK_FACET_LIMIT', 50)
+    if connection.vendor == 'postgresql':
+        facets = _grouping_sets_counts(queryset, fields, limit)
+    else:
+        facets = _grouped_counts(queryset, fields, limit)
+    return {
+        field: [{'value': value, 'count': count} for value, count in counts[:limit]]
+        for field, counts in facets.items()
+    }
+
+
+def cached_facets(scope, query_params, queryset, fields):
+    key = facet_cache_key(scope, query_params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, fields)
+        cache.set(key, facets, getattr(settings, 'BOOK_FACETS_CACHE_TIMEOUT', 300))
+    return facets
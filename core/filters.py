@@ -0,0 +1,32 @@
+import django_filters
+
+from .models import Transaction
+
+
+class TransactionFilter(django_filters.FilterSet):
+    """
+    Filters for /api/transactions/. Also applied to `TransactionArchive`
+    querysets (the field names match), so a date-bounded listing can reach
+    into archived history.
+    """
+    transaction_date_after = django_filters.DateTimeFilter(field_name='transaction_date', lookup_expr='gte')
+    transaction_date_before = django_filters.DateTimeFilter(field_name='transaction_date', lookup_expr='lt')
+
+    class Meta:
+        model = Transaction
+        fields = ['user', 'book', 'transaction_type', 'due_date', 'return_date']
+
+    DATE_FILTERS = ('transaction_date_after', 'transaction_date_before')
+
+    def reaches_archive(self, cutoff):
+        """
+        True when a transaction_date filter was given and its range can
+        include rows older than the archive cutoff.
+        """
+        if not self.is_valid():
+            return False
+        data = self.form.cleaned_data
+        if not any(data.get(name) for name in self.DATE_FILTERS):
+            return False
+        after = data.get('transaction_date_after')
+        return after is None or after < cutoff
@@ -0,0 +1,96 @@
+"""
+`Idempotency-Key` support for POST actions that kiosks retry (checkout, return, mark-as-paid).
+
+The first response for a key is stored in the cache for IDEMPOTENCY_KEY_TTL
+seconds and replayed, with an `Idempotent-Replayed: true` header, for every
+retry with the same key. Keys are scoped to the user and path. Reusing a key
+with a different request body returns 422. While the first request is still
+running, a duplicate waits up to IDEMPOTENCY_WAIT_SECONDS for its response,
+then gives up with 409 instead of running the action a second time.
+
+The in-flight lock is a `cache.add()`, so the cache must be shared between
+workers (see CACHES) for keys to hold across processes. Server errors (5xx)
+are not stored, so the client can retry them.
+"""
+import functools
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+def _cache_key(request, key):
+    scope = f"{request.user.pk}:{request.path}:{key}"
+    return f"idempotency:{hashlib.sha256(scope.encode()).hexdigest()}"
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}:{body}".encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response({'error': f"{HEADER} was already used with a different request body."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(stored['data'], status=stored['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Decorator for viewset actions. Requests without an Idempotency-Key header
+    run as before.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response_key = _cache_key(request, key)
+        lock_key = f"{response_key}:lock"
+        fingerprint = _fingerprint(request)
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 2)
+        while True:
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            if cache.add(lock_key, owner, getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 30)):
+                break
+            if time.monotonic() >= deadline:
+                response = Response({'error': 'A request with this Idempotency-Key is still in progress.'},
+                                    status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            # The first request may have finished between our cache.get() and cache.add().
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(response_key, {'fingerprint': fingerprint, 'status': response.status_code, 'data': response.data},
+                          getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600))
+            return response
+        finally:
+            if cache.get(lock_key) == owner:
+                cache.delete(lock_key)
+
+    return wrapper
@@ -0,0 +1,353 @@
+"""
+Mixed-workload load generator for the library API.
+
+Simulates concurrent desk (librarian) and kiosk (patron) sessions against
+the project's WSGI or ASGI application in-process, or against a running
+server over HTTP, then checks data invariants in the database. Driven by
+`manage.py loadtest`.
+
+Desk sessions check books out (some already overdue, so returns produce
+fees), return them and mark fees as paid; kiosk sessions obtain tokens,
+search the catalog and open book details.
+"""
+import asyncio
+import http.client
+import io
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import User, Book, Transaction, TransactionArchive, Fee
+
+PREFIX = 'loadtest'
+PASSWORD = 'loadtest-password'
+DESK_OPERATIONS = ('token', 'search', 'detail', 'checkout', 'return', 'pay')
+KIOSK_OPERATIONS = ('token', 'search', 'detail')
+DEFAULT_MIX = {'token': 2, 'search': 35, 'detail': 30, 'checkout': 15, 'return': 12, 'pay': 6}
+
+
+# Transports -----------------------------------------------------------------
+
+class WSGITransport:
+    """Calls the WSGI application directly, one request per call, from any thread."""
+    name = 'wsgi'
+
+    def __init__(self):
+        from library_system.wsgi import application
+        self.application = application
+
+    def request(self, method, path, body=None, token=None):
+        path, _, query = path.partition('?')
+        payload = json.dumps(body).encode() if body is not None else b''
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(payload)),
+            'wsgi.input': io.BytesIO(payload), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        status = []
+        result = self.application(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return status[0], content
+
+    def close(self):
+        pass
+
+
+class ASGITransport:
+    """
+    Runs the ASGI application on one shared event loop (like a single ASGI
+    server process); worker threads submit requests to it and wait.
+    """
+    name = 'asgi'
+
+    def __init__(self):
+        from library_system.asgi import application
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def _request(self, method, path, body, token):
+        path, _, query = path.partition('?')
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                   (b'content-length', str(len(payload)).encode())]
+        if token:
+            headers.append((b'authorization', f'Bearer {token}'.encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'headers': headers, 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        sent = False
+        response = {'status': 500, 'body': []}
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': payload, 'more_body': False}
+            await asyncio.Event().wait() # Never disconnect mid-request
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+
+        await self.application(scope, receive, send)
+        return response['status'], b''.join(response['body'])
+
+    def request(self, method, path, body=None, token=None):
+        return asyncio.run_coroutine_threadsafe(self._request(method, path, body, token), self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class HTTPTransport:
+    """Talks to a running server (e.g. gunicorn or uvicorn) with one keep-alive connection per thread."""
+    name = 'http'
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        try:
+            self.local.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.local.conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            del self.local.conn
+            raise
+
+    def close(self):
+        pass
+
+
+# Fixtures -------------------------------------------------------------------
+
+def setup_fixtures(patrons, books):
+    """Create the desk account, patrons and books used by the run (idempotent)."""
+    password = make_password(PASSWORD) # Hash once; every load-test account shares it
+    User.objects.update_or_create(
+        username=f'{PREFIX}-desk', defaults={'password': password, 'is_staff': True, 'user_type': 'staff'}
+    )
+    User.objects.bulk_create(
+        [User(username=f'{PREFIX}-patron-{i}', password=password, email=f'{PREFIX}-{i}@library.local') for i in range(patrons)],
+        ignore_conflicts=True,
+    )
+    Book.objects.bulk_create(
+        [Book(isbn=f'LT{i:011d}', title=f'Loadtest Book {i}', authors=f'Author {i % 97}',
+              category=f'Category {i % 12}', language='en', description='x' * 500) for i in range(books)],
+        ignore_conflicts=True,
+    )
+
+
+def cleanup_fixtures():
+    users = User.objects.filter(username__startswith=f'{PREFIX}-')
+    Fee.objects.filter(user__in=users).delete()
+    Transaction.objects.filter(user__in=users).delete()
+    TransactionArchive.objects.filter(user__in=users).delete()
+    Book.objects.filter(isbn__startswith='LT').delete()
+    users.delete()
+
+
+# Sessions -------------------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.rejected = defaultdict(int) # Expected 4xx, e.g. checking out a book someone else just took
+        self.errors = defaultdict(int)
+
+    def record(self, operation, seconds, status):
+        with self.lock:
+            self.latencies[operation].append(seconds)
+            if status >= 500:
+                self.errors[operation] += 1
+            elif status >= 400:
+                self.rejected[operation] += 1
+
+
+class Session:
+    def __init__(self, transport, stats, username, operations, mix, book_ids, patron_ids, rng):
+        self.transport, self.stats, self.username = transport, stats, username
+        self.operations = operations
+        self.weights = np.array([mix.get(op, 0) for op in operations], dtype=float)
+        self.book_ids, self.patron_ids, self.rng = book_ids, patron_ids, rng
+        self.token = None
+        self.open_loans = []
+
+    def call(self, operation, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, content = self.transport.request(method, path, body, self.token)
+        except Exception: # Connection failures count as server errors
+            status, content = 599, b''
+        self.stats.record(operation, time.perf_counter() - started, status)
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    def obtain_token(self):
+        status, data = self.call('token', 'POST', '/api/token/', {'username': self.username, 'password': PASSWORD})
+        if status == 200:
+            self.token = data['access']
+
+    def run_one(self):
+        if self.token is None:
+            return self.obtain_token()
+        operation = self.operations[self.rng.choice(len(self.operations), p=self.weights / self.weights.sum())]
+        getattr(self, f'op_{operation}')()
+
+    def op_token(self):
+        self.obtain_token()
+
+    def op_search(self):
+        term = self.rng.integers(0, 100)
+        self.call('search', 'GET', f'/api/books/?search=Book%20{term}&fields=id,title,status')
+
+    def op_detail(self):
+        self.call('detail', 'GET', f'/api/books/{self.rng.choice(self.book_ids)}/')
+
+    def op_checkout(self):
+        # A third of loans are created already overdue so their return must raise a fee.
+        overdue = self.rng.random() < 0.33
+        due = timezone.localdate() - timedelta(days=3) if overdue else timezone.localdate() + timedelta(days=14)
+        status, data = self.call('checkout', 'POST', '/api/transactions/checkout/', {
+            'user': int(self.rng.choice(self.patron_ids)), 'book': str(self.rng.choice(self.book_ids)),
+            'transaction_type': 'checkout', 'due_date': due.isoformat(),
+        })
+        if status == 201:
+            self.open_loans.append(data['id'])
+
+    def op_return(self):
+        if not self.open_loans:
+            return self.op_checkout()
+        loan = self.open_loans.pop(self.rng.integers(0, len(self.open_loans)))
+        self.call('return', 'POST', f'/api/transactions/{loan}/return/', {})
+
+    def op_pay(self):
+        status, data = self.call('pay', 'GET', '/api/fees/?paid_status=false&fields=id&facets=false')
+        if status == 200 and data['results']:
+            fee = data['results'][self.rng.integers(0, len(data['results']))]['id']
+            self.call('pay', 'POST', f'/api/fees/{fee}/mark-as-paid/', {})
+
+
+def run_load(transport, concurrency=8, duration=10.0, desk_ratio=0.3, mix=None, seed=None):
+    """Run `concurrency` sessions for `duration` seconds; returns (Stats, elapsed seconds)."""
+    mix = mix or DEFAULT_MIX
+    stats = Stats()
+    book_ids = list(Book.objects.filter(isbn__startswith='LT').values_list('id', flat=True))
+    patrons = list(User.objects.filter(username__startswith=f'{PREFIX}-patron-').values_list('id', 'username'))
+    if not book_ids or not patrons:
+        raise ValueError('No load-test fixtures found; run setup_fixtures() first.')
+    patron_ids = [pk for pk, _ in patrons]
+    seeds = np.random.SeedSequence(seed).spawn(concurrency)
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        rng = np.random.default_rng(seeds[index])
+        desk = index < max(1, round(concurrency * desk_ratio))
+        if desk:
+            session = Session(transport, stats, f'{PREFIX}-desk', DESK_OPERATIONS, mix, book_ids, patron_ids, rng)
+        else:
+            username = patrons[rng.integers(0, len(patrons))][1]
+            session = Session(transport, stats, username, KIOSK_OPERATIONS, mix, book_ids, patron_ids, rng)
+        try:
+            while time.perf_counter() < deadline:
+                session.run_one()
+        finally:
+            connections.close_all() # Each thread owns its DB connections
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.perf_counter() - started
+
+
+def summarize(stats, elapsed):
+    """Rows of (operation, count, ops/s, p50, p90, p99, max in ms, rejected, errors), plus a total row."""
+    rows = []
+    all_latencies = []
+    for operation in DESK_OPERATIONS:
+        latencies = stats.latencies.get(operation)
+        if not latencies:
+            continue
+        all_latencies += latencies
+        rows.append(_summary_row(operation, latencies, elapsed, stats.rejected[operation], stats.errors[operation]))
+    if all_latencies:
+        rows.append(_summary_row('total', all_latencies, elapsed, sum(stats.rejected.values()), sum(stats.errors.values())))
+    return rows
+
+
+def _summary_row(name, latencies, elapsed, rejected, errors):
+    ms = np.array(latencies) * 1000
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return (name, len(ms), len(ms) / elapsed, p50, p90, p99, ms.max(), rejected, errors)
+
+
+# Invariants -----------------------------------------------------------------
+
+def check_invariants():
+    """
+    Returns {name: [sample ids]} for every violated invariant, limited to
+    load-test data: a book with more than one open loan, a borrowed/available
+    status that disagrees with open loans, and a late return without exactly
+    one fee.
+    """
+    transactions = Transaction.objects.filter(user__username__startswith=f'{PREFIX}-')
+    open_loans = transactions.filter(transaction_type='checkout', return_date__isnull=True)
+    books = Book.objects.filter(isbn__startswith='LT')
+    late_returns = transactions.filter(return_date__isnull=False, due_date__lt=F('return_date__date'))
+
+    violations = {
+        'book checked out more than once': list(
+            open_loans.values('book_id').annotate(n=Count('id')).filter(n__gt=1).values_list('book_id', flat=True)[:20]
+        ),
+        'book borrowed without an open loan': list(
+            books.filter(status='borrowed').exclude(id__in=open_loans.values('book_id')).values_list('id', flat=True)[:20]
+        ),
+        'book available with an open loan': list(
+            books.filter(status='available', id__in=open_loans.values('book_id')).values_list('id', flat=True)[:20]
+        ),
+        'overdue return without a fee': list(
+            late_returns.filter(fee_record__isnull=True).values_list('id', flat=True)[:20]
+        ),
+        'overdue return with more than one fee': list(
+            Fee.objects.filter(transaction__in=late_returns).values('transaction_id')
+            .annotate(n=Count('id')).filter(n__gt=1).values_list('transaction_id', flat=True)[:20]
+        ),
+    }
+    return {name: ids for name, ids in violations.items() if ids}
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import archive_after_days, archivable_transactions, archive_transactions
+
+
+class Command(BaseCommand):
+    help = "Move returned transactions older than the archive horizon into the archive table, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Archive loans returned more than this many days ago (default: TRANSACTION_ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows moved per database transaction (default: TRANSACTION_ARCHIVE_BATCH_SIZE).')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches, e.g. to bound a maintenance window.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be archived.')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days'] if options['older_than_days'] is not None else archive_after_days()
+        cutoff = timezone.now() - timedelta(days=days)
+
+        if options['dry_run']:
+            count = archivable_transactions(cutoff).count()
+            self.stdout.write(f"{count} transaction(s) returned before {cutoff:%Y-%m-%d} would be archived.")
+            return
+
+        total = archive_transactions(
+            cutoff=cutoff,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            progress=lambda n: self.stdout.write(f"  archived {n} so far..."),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} transaction(s) returned before {cutoff:%Y-%m-%d}."))
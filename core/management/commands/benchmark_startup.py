@@ -0,0 +1,58 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: time to import and set up the WSGI app, then to serve one request.
+CHILD = r"""
+import io, json, sys, time
+started = time.perf_counter()
+from library_system.wsgi import application
+booted = time.perf_counter()
+path, _, query = sys.argv[1].partition('?')
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+    'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+status = []
+body = b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+served = time.perf_counter()
+print(json.dumps({'boot': booted - started, 'first_request': served - booted, 'status': status[0], 'modules': len(sys.modules)}))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Measure worker startup (import + app setup) and time to first request for one or more settings "
+            "modules, each in fresh interpreters, e.g. to compare the default and production profiles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('settings_modules', nargs='*',
+                            help='Settings modules to compare (default: the current one and library_system.settings_production).')
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per settings module (default: 5).')
+        parser.add_argument('--path', default='/api/', help='Path of the first request (default: /api/).')
+
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or [os.environ.get('DJANGO_SETTINGS_MODULE', 'library_system.settings'),
+                                                  'library_system.settings_production']
+        self.stdout.write(f"{'settings':<40}{'boot ms':>10}{'first req ms':>14}{'total ms':>10}{'modules':>9}  status")
+        for module in modules:
+            runs = [self.run_child(module, options['path']) for _ in range(options['runs'])]
+            boot = statistics.median(run['boot'] for run in runs) * 1000
+            first = statistics.median(run['first_request'] for run in runs) * 1000
+            self.stdout.write(
+                f"{module:<40}{boot:>10.1f}{first:>14.1f}{boot + first:>10.1f}{runs[0]['modules']:>9}  {runs[0]['status']}"
+            )
+
+    def run_child(self, module, path):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': module}
+        result = subprocess.run([sys.executable, '-c', CHILD, path], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f"Startup run for {module} failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
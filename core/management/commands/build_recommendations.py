@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.recommendations import rebuild_recommendations, update_recommendations
+
+
+class Command(BaseCommand):
+    help = "Build the 'also borrowed' recommendation table from checkout history (full, or incremental with --incremental)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only fold in transactions since the last build (falls back to a full build the first time).')
+        parser.add_argument('--top-k', type=int, default=None, help='Related books kept per book (default: RECOMMENDATIONS_TOP_K).')
+        parser.add_argument('--max-basket', type=int, default=None,
+                            help="Most recent distinct books per patron considered (default: RECOMMENDATIONS_MAX_BASKET).")
+        parser.add_argument('--pair-budget', type=int, default=None,
+                            help='Book pairs expanded in memory at once (default: RECOMMENDATIONS_PAIR_BUDGET).')
+        parser.add_argument('--block-size', type=int, default=None,
+                            help='Full builds only: source books per pass, to bound the co-occurrence table '
+                                 '(default: RECOMMENDATIONS_BLOCK_SIZE).')
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            build = update_recommendations(options['top_k'], options['max_basket'], options['pair_budget'])
+        else:
+            build = rebuild_recommendations(options['top_k'], options['max_basket'], options['pair_budget'], options['block_size'])
+        elapsed = (build.finished_at - build.started_at).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"{build.get_build_type_display()} build: {build.transactions_seen} transaction(s), "
+            f"{build.books_updated} book(s) updated in {elapsed:.1f}s."
+        ))
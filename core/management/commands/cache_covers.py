@@ -0,0 +1,35 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from core.covers import CoverError, executor, ingest_url, run_in_worker, stale_covers, uncached_books
+
+
+class Command(BaseCommand):
+    help = "Fetch and thumbnail the cover_image_url of books that have no cached cover yet, and re-queue covers stuck pending."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry covers whose last fetch failed.')
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many books.')
+
+    def handle(self, *args, **options):
+        books = uncached_books(options['retry_failed']).order_by('pk').only('pk', 'cover_image_url')
+        if options['limit']:
+            books = books[:options['limit']]
+        jobs, skipped = [], 0
+        for book in list(books): # Read first: the workers write while we queue
+            try:
+                ingest_url(book, book.cover_image_url, queue=False)
+            except CoverError:
+                skipped += 1
+                continue
+            jobs.append(executor().submit(run_in_worker, book.pk))
+        # Stuck jobs are re-run as they are, so an uploaded original is kept rather than replaced by the URL.
+        stale = stale_covers().order_by('pk').values_list('pk', flat=True)
+        if options['limit']:
+            stale = stale[:options['limit']]
+        jobs += [executor().submit(run_in_worker, book_id) for book_id in list(stale)]
+
+        done, _ = wait(jobs)
+        ready = sum(1 for job in done if job.exception() is None and job.result() is not None and job.result().status == 'ready')
+        self.stdout.write(self.style.SUCCESS(f"{ready} of {len(jobs)} cover(s) cached") + f", {skipped} unsupported URL(s) skipped.")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.consistency import CHECKS, find_inconsistencies, repair_inconsistencies
+
+
+class Command(BaseCommand):
+    help = "Find books whose status disagrees with open loans and late returns without a fee; optionally repair them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='append', dest='checks', default=None, metavar='NAME',
+                            help=f"Only run this check (repeatable): {', '.join(CHECKS)}.")
+        parser.add_argument('--sample-size', type=int, default=None,
+                            help='Offending rows listed per check (default: CONSISTENCY_SAMPLE_SIZE).')
+        parser.add_argument('--repair', action='store_true', help='Repair what can be repaired, in batches.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows repaired per batch (default: CONSISTENCY_REPAIR_BATCH_SIZE).')
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options['checks'] or [] if name not in CHECKS]
+        if unknown:
+            raise CommandError(f"Unknown check(s): {', '.join(unknown)}. Choose from: {', '.join(CHECKS)}.")
+
+        report = find_inconsistencies(options['checks'], options['sample_size'])
+        for name, result in report.items():
+            style = self.style.WARNING if result['count'] else self.style.SUCCESS
+            self.stdout.write(style(f"{name}: {result['count']}") + f"  {result['description']}")
+            for value in result['sample']:
+                self.stdout.write(f"    {value}")
+
+        if not options['repair']:
+            return
+        to_repair = [name for name, result in report.items() if result['count']]
+        if not to_repair:
+            self.stdout.write(self.style.SUCCESS("Nothing to repair."))
+            return
+        for name, repaired in repair_inconsistencies(to_repair, options['batch_size']).items():
+            self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} row(s) for {name}."))
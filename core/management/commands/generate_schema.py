@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library_system.api_docs import generate_schema_json
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema once (e.g. at deploy time) for the cached /openapi.json endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Where to write the schema (default: API_SCHEMA_FILE).')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.API_SCHEMA_FILE
+        content = generate_schema_json()
+        with open(output, 'wb') as schema_file:
+            schema_file.write(content)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(content)} bytes of OpenAPI schema to {output}."))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.roster import import_roster, invitation_url, read_roster, send_invitations, RosterError
+
+
+class Command(BaseCommand):
+    help = "Create or update accounts from a CSV/XLSX roster (username, email, first_name, last_name, user_type)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Roster file (.csv or .xlsx).')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows upserted per batch (default: ROSTER_IMPORT_BATCH_SIZE).')
+        parser.add_argument('--default-user-type', default='student',
+                            help='user_type for rows that leave it empty (default: student).')
+        parser.add_argument('--deactivate-missing', action='store_true',
+                            help='Deactivate active students who are not on this roster (skipped if any row fails).')
+        parser.add_argument('--send-invitations', action='store_true',
+                            help='Email new accounts a link to choose their password.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            if options['send_invitations']:
+                invitation_url() # Fail before importing, not after the accounts exist
+            with open(path, 'rb') as fileobj:
+                roster_import = import_roster(
+                    read_roster(fileobj, path),
+                    filename=path,
+                    batch_size=options['batch_size'],
+                    deactivate_missing=options['deactivate_missing'],
+                    default_user_type=options['default_user_type'],
+                    progress=lambda ri: self.stdout.write(
+                        f"  {ri.rows_processed} row(s): {ri.created_count} created, {ri.updated_count} updated, {ri.error_count} error(s)"
+                    ),
+                )
+        except (OSError, RosterError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {roster_import.rows_processed} row(s): {roster_import.created_count} created, "
+            f"{roster_import.updated_count} updated, {roster_import.deactivated_count} deactivated."
+        ))
+        for error in roster_import.errors:
+            self.stdout.write(self.style.WARNING(f"  line {error['line']}: {error['error']}"))
+        if roster_import.error_count > len(roster_import.errors):
+            self.stdout.write(self.style.WARNING(f"  ... and {roster_import.error_count - len(roster_import.errors)} more error(s)."))
+        if options['deactivate_missing'] and roster_import.error_count:
+            self.stdout.write(self.style.WARNING("Missing students were not deactivated because some rows failed."))
+        if options['send_invitations']:
+            self.stdout.write(f"Sent {send_invitations(roster_import)} invitation(s).")
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import (
+    ASGITransport, HTTPTransport, WSGITransport, DEFAULT_MIX,
+    check_invariants, cleanup_fixtures, run_load, setup_fixtures, summarize,
+)
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX or not weight.strip().isdigit():
+            raise CommandError(f"Invalid --mix entry '{part}'. Use e.g. search=40,checkout=10 with: {', '.join(DEFAULT_MIX)}.")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+class Command(BaseCommand):
+    help = ("Drive a mixed desk/kiosk workload against the API (in-process WSGI or ASGI, or a running server), "
+            "report throughput and latency percentiles, then check data invariants.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transport', choices=['wsgi', 'asgi', 'http'], default='wsgi')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server address for --transport http.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent sessions (default: 8).')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30).')
+        parser.add_argument('--desk-ratio', type=float, default=0.3,
+                            help='Share of sessions that are librarian desks; the rest are patron kiosks (default: 0.3).')
+        parser.add_argument('--mix', type=parse_mix, default=None,
+                            help=f"Operation weights, e.g. search=40,checkout=10 (default: {DEFAULT_MIX}).")
+        parser.add_argument('--patrons', type=int, default=200, help='Load-test patron accounts to create (default: 200).')
+        parser.add_argument('--books', type=int, default=2000, help='Load-test books to create (default: 2000).')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--cleanup', action='store_true', help='Delete all load-test data and exit.')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            cleanup_fixtures()
+            self.stdout.write(self.style.SUCCESS('Load-test data removed.'))
+            return
+
+        setup_fixtures(options['patrons'], options['books'])
+        if options['transport'] == 'http':
+            transport = HTTPTransport(options['url'])
+        elif options['transport'] == 'asgi':
+            transport = ASGITransport()
+        else:
+            transport = WSGITransport()
+
+        self.stdout.write(f"Running {options['concurrency']} session(s) over {transport.name} for {options['duration']}s...")
+        try:
+            stats, elapsed = run_load(transport, options['concurrency'], options['duration'],
+                                      options['desk_ratio'], options['mix'], options['seed'])
+        finally:
+            transport.close()
+
+        self.stdout.write(f"{'operation':<10}{'count':>8}{'ops/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'4xx':>7}{'5xx':>7}")
+        for name, count, rate, p50, p90, p99, peak, rejected, errors in summarize(stats, elapsed):
+            self.stdout.write(f"{name:<10}{count:>8}{rate:>9.1f}{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}{peak:>9.1f}{rejected:>7}{errors:>7}")
+
+        violations = check_invariants()
+        if violations:
+            for name, ids in violations.items():
+                self.stdout.write(self.style.ERROR(f"Invariant violated: {name} (e.g. {', '.join(map(str, ids[:5]))})"))
+            raise CommandError(f"{len(violations)} invariant(s) violated.")
+        self.stdout.write(self.style.SUCCESS('All invariants hold.'))
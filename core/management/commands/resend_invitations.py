@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.roster import pending_invitations, resend_invitations, RosterError
+
+
+class Command(BaseCommand):
+    help = "Email a new invitation to active accounts that have not chosen a password yet (e.g. their link expired)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only these accounts (default: every account without a password).')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages sent per SMTP batch.')
+
+    def handle(self, *args, **options):
+        users = pending_invitations()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        try:
+            sent = resend_invitations(users, batch_size=options['batch_size'])
+        except RosterError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} invitation(s)."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.notices import pending_notices, send_loan_notices
+
+
+class Command(BaseCommand):
+    help = "Email each patron one digest of loans due soon and loans overdue. Safe to rerun."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--due-in-days', type=int, default=3,
+                            help='Remind about loans due exactly this many days from today (default: 3).')
+        parser.add_argument('--overdue-interval-days', type=int, default=7,
+                            help='Repeat overdue notices at most this often (default: 7).')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows fetched per chunk and emails sent per batch (default: 500).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many loans would be notified.')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['dry_run']:
+            count = pending_notices(today, options['due_in_days'], options['overdue_interval_days']).count()
+            self.stdout.write(f"{count} loan(s) would be included in notices today.")
+            return
+
+        stats = send_loan_notices(
+            today,
+            due_in_days=options['due_in_days'],
+            overdue_interval_days=options['overdue_interval_days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {stats['emails']} email(s): {stats['due_soon']} due-soon and {stats['overdue']} overdue loan(s)."
+        ))
+        if stats['skipped_no_email']:
+            self.stdout.write(self.style.WARNING(f"Skipped {stats['skipped_no_email']} loan(s) of patrons without an email address."))
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class CreatePartitionedModel(migrations.CreateModel):
+    """
+    CreateModel whose table is range-partitioned on `partition_by` on
+    PostgreSQL; other backends get the plain table. Monthly partitions of the
+    archive are created on demand by core.archive.ensure_month_partition.
+
+    The migration state is the ordinary model. PostgreSQL requires the
+    partition column in the primary key, so the table's key is
+    (id, partition_by); ids stay unique because they are copied from
+    Transaction. Columns, foreign keys and indexes are generated from the
+    model by the schema editor, so they get the names Django would have
+    given them and later migrations can alter them as usual.
+    """
+
+    def __init__(self, *args, partition_by, **kwargs):
+        self.partition_by = partition_by
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, args, {**kwargs, "partition_by": self.partition_by}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        quote = schema_editor.quote_name
+        fields = model._meta.local_fields
+        columns = [
+            f"{quote(field.column)} {field.db_type(schema_editor.connection)} {'NULL' if field.null else 'NOT NULL'}"
+            for field in fields
+        ]
+        partition_key = quote(model._meta.get_field(self.partition_by).column)
+        schema_editor.execute(
+            f"CREATE TABLE {quote(model._meta.db_table)} ({', '.join(columns)}, "
+            f"PRIMARY KEY ({quote(model._meta.pk.column)}, {partition_key})) PARTITION BY RANGE ({partition_key})"
+        )
+        for field in fields:
+            if field.remote_field and field.db_constraint:
+                schema_editor.deferred_sql.append(
+                    schema_editor._create_fk_sql(model, field, "_fk_%(to_table)s_%(to_column)s")
+                )
+            schema_editor.deferred_sql.extend(schema_editor._field_indexes_sql(model, field))
+
+    def describe(self):
+        return f"{super().describe()} (partitioned by {self.partition_by} on PostgreSQL)"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["return_date"], name="core_txn_return_date_idx"),
+        ),
+        CreatePartitionedModel(
+            name="TransactionArchive",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[
+                            ("checkout", "Checkout"),
+                            ("return", "Return"),
+                            ("renew", "Renew"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("transaction_date", models.DateTimeField()),
+                ("due_date", models.DateField(blank=True, null=True)),
+                ("return_date", models.DateTimeField(blank=True, null=True)),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_transactions",
+                        to="core.book",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_transactions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            partition_by="transaction_date",
+        ),
+        migrations.AddField(
+            model_name="fee",
+            name="archived_transaction",
+            field=models.OneToOneField(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="fee_record",
+                to="core.transactionarchive",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_transaction_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookTombstone",
+            fields=[
+                ("book_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("isbn", models.CharField(max_length=13)),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["updated_at", "id"], name="core_book_updated_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booktombstone",
+            index=models.Index(
+                fields=["deleted_at", "book_id"], name="core_tombstone_deleted_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:44
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_book_change_feed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoanNotice",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "notice_type",
+                    models.CharField(
+                        choices=[("due_soon", "Due Soon"), ("overdue", "Overdue")],
+                        max_length=10,
+                    ),
+                ),
+                ("sent_on", models.DateField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(("return_date__isnull", True)),
+                fields=["due_date"],
+                name="core_txn_open_due_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="loannotice",
+            name="transaction",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notices",
+                to="core.transaction",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="loannotice",
+            constraint=models.UniqueConstraint(
+                fields=("transaction", "notice_type", "sent_on"),
+                name="core_loannotice_once_per_day",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:46
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_loan_notices"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecommendationBuild",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "build_type",
+                    models.CharField(
+                        choices=[("full", "Full"), ("incremental", "Incremental")],
+                        max_length=12,
+                    ),
+                ),
+                ("watermark", models.DateTimeField(blank=True, null=True)),
+                ("transactions_seen", models.PositiveIntegerField(default=0)),
+                ("books_updated", models.PositiveIntegerField(default=0)),
+                ("started_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BookRecommendation",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("co_borrowers", models.PositiveIntegerField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recommendations",
+                        to="core.book",
+                    ),
+                ),
+                (
+                    "related_book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="core.book",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "rank"), name="core_bookrec_book_rank_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_book_recommendations"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="fee",
+            index=models.Index(fields=["created_at"], name="core_fee_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["transaction_date"], name="core_txn_date_idx"),
+        ),
+    ]
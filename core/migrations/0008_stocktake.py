@@ -0,0 +1,75 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_revoked_tokens"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Stocktake",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("name", models.CharField(blank=True, max_length=255)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("open", "Open"), ("confirmed", "Confirmed")],
+                        default="open",
+                        max_length=10,
+                    ),
+                ),
+                ("scan_count", models.PositiveIntegerField(default=0)),
+                ("lost_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("confirmed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "started_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="stocktakes",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StocktakeScan",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("isbn", models.CharField(max_length=13)),
+                (
+                    "stocktake",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="scans",
+                        to="core.stocktake",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["stocktake", "isbn"], name="core_stocktakescan_isbn_idx"
+                    )
+                ],
+            },
+        ),
+    ]
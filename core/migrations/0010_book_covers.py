@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_roster_import"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookCover",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="cover",
+                        serialize=False,
+                        to="core.book",
+                    ),
+                ),
+                ("source_url", models.URLField(blank=True, max_length=500)),
+                ("checksum", models.CharField(blank=True, max_length=64)),
+                ("content_type", models.CharField(blank=True, max_length=100)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("ready", "Ready"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:21
+
+from django.db import migrations, models
+
+
+def create_counter(apps, schema_editor):
+    """Existing books and tombstones keep change_seq 0; sync tokens issued before this migration are rejected."""
+    apps.get_model("core", "CatalogSequence").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_book_covers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="book",
+            name="core_book_updated_id_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="booktombstone",
+            name="core_tombstone_deleted_idx",
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="change_seq",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="booktombstone",
+            name="change_seq",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["change_seq", "id"], name="core_book_change_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booktombstone",
+            index=models.Index(
+                fields=["change_seq", "book_id"], name="core_tombstone_change_idx"
+            ),
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
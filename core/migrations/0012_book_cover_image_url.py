@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:25
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def record_current_urls(apps, schema_editor):
+    """Existing covers belong to the book's current URL, so the next save of the book does not fetch it again."""
+    Book = apps.get_model("core", "Book")
+    BookCover = apps.get_model("core", "BookCover")
+    current_url = Book.objects.filter(pk=OuterRef("book_id")).values("cover_image_url")[:1]
+    BookCover.objects.update(cover_image_url=Coalesce(Subquery(current_url), Value("")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_change_sequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookcover",
+            name="cover_image_url",
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.RunPython(record_current_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _split_param(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin adding ?fields=a,b and ?exclude=c,d to read requests.
+
+    The serializer output is trimmed to the requested fields, and the queryset
+    is narrowed to match: ?fields= uses .only() and ?exclude= uses .defer(), so
+    columns nobody asked for (e.g. Book.description) are never fetched.
+    Unknown field names are rejected with a 400.
+    """
+    fields_param = 'fields'
+    exclude_param = 'exclude'
+
+    def get_sparse_fieldset(self):
+        """
+        Returns (kept serializer field names, whether ?fields= was used), or
+        None when the request does not ask for a sparse fieldset.
+        """
+        if hasattr(self, '_sparse_fieldset'):
+            return self._sparse_fieldset
+        fieldset = None
+        request = getattr(self, 'request', None)
+        if request is not None and request.method in SAFE_METHODS:
+            fields = _split_param(request.query_params.get(self.fields_param))
+            exclude = _split_param(request.query_params.get(self.exclude_param))
+            if fields or exclude:
+                allowed = list(self.get_serializer_class()().fields)
+                errors = {}
+                for param, names in ((self.fields_param, fields), (self.exclude_param, exclude)):
+                    unknown = [name for name in names if name not in allowed]
+                    if unknown:
+                        errors[param] = [f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}."]
+                if errors:
+                    raise ValidationError(errors)
+                keep = [name for name in (fields or allowed) if name not in exclude]
+                fieldset = (keep, bool(fields))
+        self._sparse_fieldset = fieldset
+        return fieldset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fieldset = self.get_sparse_fieldset()
+        if fieldset is None:
+            return queryset
+        keep, use_only = fieldset
+
+        opts = queryset.model._meta
+        model_fields = {field.name for field in opts.concrete_fields}
+        sources = {name: field.source for name, field in self.get_serializer_class()().fields.items()}
+
+        # .only() is safe when every kept field maps straight onto a column; computed
+        # fields may read anything, so fall back to deferring just the dropped columns.
+        if use_only and all(sources[name] in model_fields for name in keep):
+            return queryset.only(opts.pk.name, *(sources[name] for name in keep))
+        dropped = [
+            source for name, source in sources.items()
+            if name not in keep and source in model_fields and source != opts.pk.name
+        ]
+        return queryset.defer(*dropped) if dropped else queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_sparse_fieldset()
+        if fieldset is not None:
+            target = getattr(serializer, 'child', serializer) # many=True wraps the real serializer
+            for name in list(target.fields):
+                if name not in fieldset[0]:
+                    target.fields.pop(name)
+        return serializer
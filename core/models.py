@@ -1,5 +1,7 @@
 import uuid
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction as db_transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
@@ -16,6 +18,39 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+class CatalogSequence(models.Model):
+    """
+    Single-row counter that numbers catalog changes for the change feed
+    (core/sync.py). Bumping it locks the row until the transaction commits,
+    so writers are numbered in commit order and a client that has seen
+    number n can never miss a later commit with a smaller one.
+    """
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def next_value(cls):
+        """Bump and return the counter. Call inside the transaction that writes the change."""
+        if not cls.objects.filter(pk=1).update(value=F('value') + 1):
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(value=F('value') + 1)
+        return cls.objects.values_list('value', flat=True).get(pk=1)
+
+
+class BookQuerySet(models.QuerySet):
+    def update_changed(self, **fields):
+        """UPDATE that also stamps updated_at and the change-feed number, as Book.save does."""
+        with db_transaction.atomic(using=self.db):
+            return self.update(change_seq=CatalogSequence.next_value(), updated_at=timezone.now(), **fields)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with db_transaction.atomic(using=self.db):
+            change_seq = CatalogSequence.next_value()
+            for obj in objs:
+                obj.change_seq = change_seq
+            return super().bulk_create(objs, *args, **kwargs)
+
+
 class Book(models.Model):
     STATUS_CHOICES = (
         ('available', 'Available'),
@@ -37,10 +72,69 @@ class Book(models.Model):
     cover_image_url = models.URLField(max_length=500, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    change_seq = models.BigIntegerField(default=0, editable=False) # CatalogSequence value of the last change (change feed)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_seq', 'id'], name='core_book_change_idx'), # Change feed sync token
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.isbn})"
 
+    def save(self, *args, **kwargs):
+        with db_transaction.atomic(using=kwargs.get('using')):
+            self.change_seq = CatalogSequence.next_value()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+            super().save(*args, **kwargs)
+
+
+class BookCover(models.Model):
+    """
+    Local copy of a book's cover, ingested from `Book.cover_image_url` or an
+    upload by `core.covers`. Files are stored under the SHA-256 of the
+    original image, so the thumbnail URLs change whenever the image does.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'), # Waiting for the worker pool to fetch and/or resize it
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='cover')
+    source_url = models.URLField(max_length=500, blank=True) # Empty for uploads
+    # Book.cover_image_url when this cover was set: the book holding another URL means there is a new one to ingest.
+    cover_image_url = models.URLField(max_length=500, blank=True)
+    checksum = models.CharField(max_length=64, blank=True) # SHA-256 of the original image; empty until fetched
+    content_type = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cover of {self.book_id} ({self.status})"
+
+
+class BookTombstone(models.Model):
+    """
+    Left behind when a book is deleted, so the catalog change feed
+    (`/api/books/changes/`) can tell synced clients to drop their copy.
+    """
+    book_id = models.UUIDField(primary_key=True)
+    isbn = models.CharField(max_length=13)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    change_seq = models.BigIntegerField(default=0) # See CatalogSequence
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_seq', 'book_id'], name='core_tombstone_change_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted book {self.isbn} ({self.deleted_at:%Y-%m-%d})"
+
 class Transaction(models.Model):
     TRANSACTION_TYPE_CHOICES = (
         ('checkout', 'Checkout'),
@@ -59,6 +153,13 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.transaction_type} - {self.book.title} by {self.user.username} on {self.transaction_date.strftime('%Y-%m-%d')}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['return_date'], name='core_txn_return_date_idx'), # Used by the archival pipeline to find completed loans
+            models.Index(fields=['due_date'], name='core_txn_open_due_idx', condition=models.Q(return_date__isnull=True)), # Open loans by due date (reminders, overdue)
+            models.Index(fields=['transaction_date'], name='core_txn_date_idx'), # Default list/admin ordering and date filters
+        ]
+
     def save(self, *args, **kwargs):
         if self.transaction_type == 'checkout' and not self.due_date:
             # Example: Set due date to 2 weeks from now
@@ -66,6 +167,89 @@ class Transaction(models.Model):
         super().save(*args, **kwargs)
 
 
+class LoanNotice(models.Model):
+    """
+    One due-date reminder or overdue notice sent for a loan. Used by
+    `manage.py send_loan_notices` to skip loans already notified, so reruns
+    on the same day send nothing twice.
+    """
+    NOTICE_TYPE_CHOICES = (
+        ('due_soon', 'Due Soon'),
+        ('overdue', 'Overdue'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='notices')
+    notice_type = models.CharField(max_length=10, choices=NOTICE_TYPE_CHOICES)
+    sent_on = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'notice_type', 'sent_on'], name='core_loannotice_once_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.notice_type} notice for {self.transaction_id} on {self.sent_on}"
+
+
+class TransactionArchive(models.Model):
+    """
+    Completed transactions moved out of the live `Transaction` table by
+    `core.archive.archive_transactions`. Rows keep their original id, so fees
+    can be re-pointed without rewriting history. On PostgreSQL the table is
+    range-partitioned by month on `transaction_date` (see migration 0002).
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='archived_transactions')
+    book = models.ForeignKey(Book, on_delete=models.PROTECT, related_name='archived_transactions')
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPE_CHOICES)
+    transaction_date = models.DateTimeField()
+    due_date = models.DateField(null=True, blank=True)
+    return_date = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.transaction_type} (archived) - {self.book_id} by {self.user_id} on {self.transaction_date.strftime('%Y-%m-%d')}"
+
+
+class BookRecommendation(models.Model):
+    """
+    Top-K "patrons who borrowed this also borrowed" entries per book, built
+    from checkout history by `core.recommendations` (see
+    `manage.py build_recommendations`).
+    """
+    id = models.BigAutoField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    related_book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    co_borrowers = models.PositiveIntegerField() # Patrons who borrowed both books
+    rank = models.PositiveSmallIntegerField() # 0 = strongest
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='core_bookrec_book_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.related_book_id} ({self.co_borrowers})"
+
+
+class RecommendationBuild(models.Model):
+    """A full or incremental run of the recommendation builder; the latest watermark drives incremental runs."""
+    BUILD_TYPE_CHOICES = (
+        ('full', 'Full'),
+        ('incremental', 'Incremental'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    build_type = models.CharField(max_length=12, choices=BUILD_TYPE_CHOICES)
+    watermark = models.DateTimeField(null=True, blank=True) # Latest transaction_date included
+    transactions_seen = models.PositiveIntegerField(default=0)
+    books_updated = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.build_type} recommendation build at {self.started_at:%Y-%m-%d %H:%M}"
+
+
 class Fee(models.Model):
     FEE_TYPE_CHOICES = (
         ('overdue', 'Overdue'),
@@ -78,6 +262,9 @@ class Fee(models.Model):
     book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='fees') # In case book is deleted
     transaction = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='fee_record') # Use OneToOneField if a fee is uniquely tied to one transaction causing it.
                                                                                                                             # Or ForeignKey if multiple fees can arise from one transaction (e.g. overdue + damage)
+    # Set instead of `transaction` once the transaction has been archived. No DB constraint because the
+    # partitioned archive table on PostgreSQL can only be unique on (id, transaction_date).
+    archived_transaction = models.OneToOneField(TransactionArchive, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False, related_name='fee_record')
     fee_type = models.CharField(max_length=10, choices=FEE_TYPE_CHOICES, default='overdue')
     amount = models.DecimalField(max_digits=6, decimal_places=2)
     paid_status = models.BooleanField(default=False)
@@ -86,9 +273,112 @@ class Fee(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='core_fee_created_idx'), # Default list/admin ordering
+        ]
+
+    OVERDUE_RATE_PER_DAY = Decimal('0.50')
+
+    @classmethod
+    def overdue_amount(cls, overdue_days):
+        return overdue_days * cls.OVERDUE_RATE_PER_DAY
+
     def __str__(self):
         return f"Fee for {self.user.username} - ${self.amount} ({'Paid' if self.paid_status else 'Unpaid'})"
 
+
+class RevokedToken(models.Model):
+    """
+    A revoked JWT, keyed by its `jti`, or a revoke-all marker for a user keyed
+    `user:<id>` (tokens issued before `revoked_at` are rejected). Rows are
+    pruned once `expires_at` passes, since the tokens would be rejected anyway.
+    See core/revocation.py.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='revoked_tokens')
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True) # Workers poll for rows revoked since their last refresh
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Revoked {self.key} (until {self.expires_at:%Y-%m-%d %H:%M})"
+
+
+class Stocktake(models.Model):
+    """
+    An inventory count: scanned ISBNs are staged in `StocktakeScan` and compared
+    to the catalog in bulk by `core.stocktake`. Confirming marks books that are
+    available but were never scanned as lost.
+    """
+    STATUS_CHOICES = (
+        ('open', 'Open'), # Accepting scans
+        ('confirmed', 'Confirmed'), # Missing books marked lost; read-only
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='stocktakes')
+    scan_count = models.PositiveIntegerField(default=0)
+    lost_count = models.PositiveIntegerField(default=0) # Books marked lost on confirmation
+    created_at = models.DateTimeField(auto_now_add=True)
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Stocktake {self.name or self.id} ({self.status})"
+
+
+class StocktakeScan(models.Model):
+    """One scanned barcode. Duplicates are kept; comparisons only ask whether an ISBN was scanned."""
+    id = models.BigAutoField(primary_key=True)
+    stocktake = models.ForeignKey(Stocktake, on_delete=models.CASCADE, related_name='scans')
+    isbn = models.CharField(max_length=13)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stocktake', 'isbn'], name='core_stocktakescan_isbn_idx'), # Anti-joins against Book.isbn
+        ]
+
+
+class RosterImport(models.Model):
+    """
+    One run of the semester roster import (`core.roster`). Counters are
+    saved after every batch, so a running import can be watched through
+    /api/roster-imports/.
+    """
+    STATUS_CHOICES = (
+        ('running', 'Running'),
+        ('finished', 'Finished'),
+        ('failed', 'Failed'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='roster_imports')
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    deactivated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True) # First few row errors: [{"line": n, "error": "..."}]
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Roster import {self.filename or self.id} ({self.status})"
+
+
+class RosterImportEntry(models.Model):
+    """A username present in a roster import; students without an entry are deactivated in one UPDATE."""
+    id = models.BigAutoField(primary_key=True)
+    roster_import = models.ForeignKey(RosterImport, on_delete=models.CASCADE, related_name='entries')
+    username = models.CharField(max_length=150)
+    created = models.BooleanField(default=False) # Account was created by this import (gets an invitation)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['roster_import', 'username'], name='core_rosterentry_user_idx'),
+        ]
+
 # Consider OtherMedia for later as per refined plan
 # class OtherMedia(models.Model):
 #     MEDIA_TYPE_CHOICES = (
@@ -0,0 +1,232 @@
+"""
+"Patrons who borrowed this also borrowed" recommendations.
+
+Checkout history (live and archived transactions) is loaded into NumPy
+arrays of (patron, book) pairs. Each patron's basket is capped at their
+`max_basket` most recent distinct books, then the item-item co-occurrence
+counts are computed with vectorised pair expansion, in chunks of patrons
+bounded by `pair_budget` pairs and, if needed, in blocks of source books so
+the distinct-pair table never outgrows memory. Only the top K related books
+per book are written to `BookRecommendation`.
+
+Incremental runs pick up transactions after the last build's watermark and
+recompute only the affected books: each newly borrowed book and every book in
+the borrowing patron's basket.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Transaction, TransactionArchive, BookRecommendation, RecommendationBuild
+
+LOAD_CHUNK = 100_000
+
+
+def _history_querysets(user_ids=None):
+    querysets = [Transaction.objects.all(), TransactionArchive.objects.all()]
+    if user_ids is not None:
+        querysets = [qs.filter(user_id__in=user_ids) for qs in querysets]
+    return querysets
+
+
+def load_baskets(user_ids=None, max_basket=200):
+    """
+    Returns (book_ids, items, starts, sizes): `items` holds dense book indices
+    grouped by patron, most recent first, with duplicates removed and each
+    basket capped at `max_basket`; book_ids maps indices back to UUIDs.
+    """
+    book_index = {}
+    user_chunks, book_chunks = [], []
+    for queryset in _history_querysets(user_ids):
+        users, books = [], []
+        rows = queryset.order_by('user_id', '-transaction_date').values_list('user_id', 'book_id').iterator(chunk_size=LOAD_CHUNK)
+        for user_id, book_id in rows:
+            users.append(user_id)
+            books.append(book_index.setdefault(book_id, len(book_index)))
+            if len(users) >= LOAD_CHUNK:
+                user_chunks.append(np.array(users, dtype=np.int64))
+                book_chunks.append(np.array(books, dtype=np.int32))
+                users, books = [], []
+        user_chunks.append(np.array(users, dtype=np.int64))
+        book_chunks.append(np.array(books, dtype=np.int32))
+
+    book_ids = list(book_index)
+    users = np.concatenate(user_chunks)
+    books = np.concatenate(book_chunks)
+    if not len(users):
+        empty = np.zeros(0, dtype=np.int64)
+        return book_ids, books, empty, empty
+
+    # Live and archived rows arrive as two sorted runs; a stable sort on patron keeps recency order within each run.
+    order = np.argsort(users, kind='stable')
+    users, books = users[order], books[order]
+
+    # Drop repeat borrowings of the same book, keeping the first (most recent) occurrence.
+    _, user_idx = np.unique(users, return_inverse=True)
+    keys = user_idx.astype(np.int64) * max(len(book_ids), 1) + books
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    user_idx, books = user_idx[first], books[first]
+
+    # Cap each basket at the most recent max_basket books.
+    starts = np.flatnonzero(np.r_[True, user_idx[1:] != user_idx[:-1]])
+    sizes = np.diff(np.r_[starts, len(user_idx)])
+    rank = np.arange(len(user_idx)) - np.repeat(starts, sizes)
+    keep = rank < max_basket
+    books, user_idx = books[keep], user_idx[keep]
+
+    starts = np.flatnonzero(np.r_[True, user_idx[1:] != user_idx[:-1]])
+    sizes = np.diff(np.r_[starts, len(user_idx)])
+    return book_ids, books, starts.astype(np.int64), sizes.astype(np.int64)
+
+
+def _basket_pairs(items, starts, sizes):
+    """Every ordered pair (a, b), a != b, of books sharing a basket."""
+    element = np.repeat(starts, sizes) + (np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes))
+    reps = np.repeat(sizes, sizes)
+    src = np.repeat(items[element], reps)
+    partner_start = np.repeat(np.repeat(starts, sizes), reps)
+    offset = np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps)
+    dst = items[partner_start + offset]
+    mask = src != dst
+    return src[mask], dst[mask]
+
+
+def _basket_chunks(starts, sizes, pair_budget):
+    """Slices of patrons whose baskets expand to at most ~pair_budget pairs."""
+    cost = np.cumsum(sizes * sizes)
+    begin = 0
+    while begin < len(sizes):
+        base = cost[begin - 1] if begin else 0
+        end = max(int(np.searchsorted(cost, base + pair_budget, side='right')), begin + 1)
+        yield slice(begin, end)
+        begin = end
+
+
+def _merge_counts(keys, counts):
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    boundaries = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[boundaries], np.add.reduceat(counts, boundaries)
+
+
+def top_k_related(items, starts, sizes, n_books, sources, top_k=10, pair_budget=20_000_000, block_size=None):
+    """
+    Yields (source, related, co_borrowers, rank) arrays for the books whose
+    dense indices are in `sources`. Memory is bounded by `pair_budget`
+    (pairs expanded at once) and `block_size` (source books per pass,
+    default RECOMMENDATIONS_BLOCK_SIZE).
+    """
+    sources = np.unique(np.asarray(sources, dtype=np.int64))
+    block_size = block_size or getattr(settings, 'RECOMMENDATIONS_BLOCK_SIZE', 50_000)
+    for block_start in range(0, len(sources), block_size):
+        block = np.zeros(n_books, dtype=bool)
+        block[sources[block_start:block_start + block_size]] = True
+
+        keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        for patrons in _basket_chunks(starts, sizes, pair_budget):
+            src, dst = _basket_pairs(items, starts[patrons], sizes[patrons])
+            wanted = block[src]
+            chunk_keys, chunk_counts = np.unique(src[wanted].astype(np.int64) * n_books + dst[wanted], return_counts=True)
+            keys, counts = _merge_counts(np.r_[keys, chunk_keys], np.r_[counts, chunk_counts])
+
+        src, dst = keys // n_books, keys % n_books
+        order = np.lexsort((dst, -counts, src)) # Per source: most co-borrowers first, ties by index
+        src, dst, counts = src[order], dst[order], counts[order]
+        group_start = np.flatnonzero(np.r_[True, src[1:] != src[:-1]]) if len(src) else np.zeros(0, dtype=np.int64)
+        rank = np.arange(len(src)) - np.repeat(group_start, np.diff(np.r_[group_start, len(src)]))
+        keep = rank < top_k
+        yield src[keep], dst[keep], counts[keep], rank[keep]
+
+
+def _write_recommendations(book_ids, results, replace_sources):
+    """Replace the stored rows of `replace_sources` (UUIDs, or None for all books)."""
+    with db_transaction.atomic():
+        if replace_sources is None:
+            BookRecommendation.objects.all().delete()
+        else:
+            BookRecommendation.objects.filter(book_id__in=replace_sources).delete()
+        written = set()
+        for src, dst, counts, rank in results:
+            BookRecommendation.objects.bulk_create(
+                [
+                    BookRecommendation(book_id=book_ids[s], related_book_id=book_ids[d], co_borrowers=int(c), rank=int(r))
+                    for s, d, c, r in zip(src, dst, counts, rank)
+                ],
+                batch_size=5000,
+            )
+            written.update(np.unique(src).tolist())
+    return len(written)
+
+
+def _options(top_k, max_basket, pair_budget):
+    return (
+        top_k or getattr(settings, 'RECOMMENDATIONS_TOP_K', 10),
+        max_basket or getattr(settings, 'RECOMMENDATIONS_MAX_BASKET', 200),
+        pair_budget or getattr(settings, 'RECOMMENDATIONS_PAIR_BUDGET', 20_000_000),
+    )
+
+
+def _watermark():
+    marks = [qs.aggregate(m=Max('transaction_date'))['m'] for qs in _history_querysets()]
+    marks = [mark for mark in marks if mark]
+    return max(marks) if marks else None
+
+
+def rebuild_recommendations(top_k=None, max_basket=None, pair_budget=None, block_size=None):
+    """Nightly full rebuild from the whole checkout history."""
+    top_k, max_basket, pair_budget = _options(top_k, max_basket, pair_budget)
+    build = RecommendationBuild.objects.create(build_type='full', watermark=_watermark())
+    book_ids, items, starts, sizes = load_baskets(max_basket=max_basket)
+    results = top_k_related(items, starts, sizes, len(book_ids), np.arange(len(book_ids)), top_k, pair_budget, block_size)
+    build.books_updated = _write_recommendations(book_ids, results, replace_sources=None)
+    build.transactions_seen = len(items)
+    build.finished_at = timezone.now()
+    build.save()
+    return build
+
+
+def update_recommendations(top_k=None, max_basket=None, pair_budget=None):
+    """
+    Fold in transactions since the last build. Falls back to a full rebuild
+    when no build has finished yet.
+    """
+    last = RecommendationBuild.objects.filter(finished_at__isnull=False, watermark__isnull=False).order_by('-started_at').first()
+    if last is None:
+        return rebuild_recommendations(top_k, max_basket, pair_budget)
+    top_k, max_basket, pair_budget = _options(top_k, max_basket, pair_budget)
+
+    new = Transaction.objects.filter(transaction_date__gt=last.watermark)
+    watermark = new.aggregate(m=Max('transaction_date'))['m'] or last.watermark
+    build = RecommendationBuild.objects.create(build_type='incremental', watermark=watermark)
+
+    patrons = list(new.values_list('user_id', flat=True).distinct())
+    build.transactions_seen = new.count()
+    if patrons:
+        # Every book in a new borrower's (capped) basket gains or changes a co-borrowing edge.
+        book_ids, items, _, _ = load_baskets(user_ids=patrons, max_basket=max_basket)
+        affected_ids = [book_ids[i] for i in np.unique(items)]
+        # Their counts also involve other patrons, so load the baskets of everyone who borrowed them.
+        all_patrons = set()
+        for qs in _history_querysets():
+            all_patrons.update(qs.filter(book_id__in=affected_ids).values_list('user_id', flat=True).distinct())
+        book_ids, items, starts, sizes = load_baskets(user_ids=list(all_patrons), max_basket=max_basket)
+        index = {book_id: i for i, book_id in enumerate(book_ids)}
+        sources = [index[book_id] for book_id in affected_ids if book_id in index]
+        results = top_k_related(items, starts, sizes, len(book_ids), sources, top_k, pair_budget)
+        build.books_updated = _write_recommendations(book_ids, results, replace_sources=affected_ids)
+
+    build.finished_at = timezone.now()
+    build.save()
+    return build
+
+
+def related_books(book, limit=None):
+    limit = limit or getattr(settings, 'RECOMMENDATIONS_TOP_K', 10)
+    return (
+        BookRecommendation.objects.filter(book=book)
+        .select_related('related_book')
+        .order_by('rank')[:limit]
+    )
@@ -0,0 +1,199 @@
+"""
+JWT revocation (logout and revoke-all) without a database lookup per request.
+
+Revoked tokens are stored in `RevokedToken`, keyed by `jti`; revoking every
+token of a user stores a `user:<id>` marker whose `revoked_at` rejects all of
+that user's tokens issued earlier. Each worker keeps a Bloom filter of the
+unexpired keys plus a small LRU of confirmed lookups. A token whose jti and
+user marker both miss the filter is accepted straight away; only filter hits
+(real revocations and the rare false positive) reach the LRU and then the
+database.
+
+Every TOKEN_REVOCATION_REFRESH_SECONDS a worker loads the rows revoked since
+its last refresh (with some overlap, so slow commits are not missed). Every
+TOKEN_REVOCATION_REBUILD_SECONDS it deletes expired rows and rebuilds the
+filter from scratch, since entries cannot be removed from a Bloom filter.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# Rows revoked up to this long before the last refresh are loaded again, to cover
+# transactions that committed late and clock drift between workers.
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+_NOT_REVOKED = object()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def _setting(name, default):
+    return getattr(settings, f'TOKEN_REVOCATION_{name}', default)
+
+
+class RevocationList:
+    """Per-process view of `RevokedToken`; use the module-level `revocation_list`."""
+
+    def __init__(self):
+        self._lock = threading.Lock() # Guards the filter, the LRU and the refresh bookkeeping
+        self._refresh_lock = threading.Lock() # One refresh or rebuild at a time
+        self._bloom = None
+        self._lru = OrderedDict()
+        self._generation = 0 # Bumped whenever keys are added, so in-flight lookups don't cache stale misses
+        self._watermark = None
+        self._refreshed_at = self._rebuilt_at = 0.0
+
+    def _add_keys(self, keys):
+        with self._lock:
+            for key in keys:
+                self._bloom.add(key)
+                self._lru.pop(key, None)
+            self._generation += 1
+
+    def rebuild(self, prune=True):
+        """Delete expired rows (if `prune`) and reload the filter from the table."""
+        now = timezone.now()
+        if prune:
+            RevokedToken.objects.filter(expires_at__lte=now).delete()
+        live = RevokedToken.objects.filter(expires_at__gt=now)
+        bloom = BloomFilter(max(_setting('BLOOM_CAPACITY', 100_000), 2 * live.count()), _setting('BLOOM_ERROR_RATE', 0.001))
+        for key in live.values_list('key', flat=True).iterator(chunk_size=10_000):
+            bloom.add(key)
+        with self._lock:
+            self._bloom = bloom
+            self._lru.clear()
+            self._generation += 1
+            self._watermark = now
+            self._refreshed_at = self._rebuilt_at = time.monotonic()
+
+    def refresh(self):
+        """Load rows revoked (by any worker) since the last refresh."""
+        now = timezone.now()
+        keys = RevokedToken.objects.filter(
+            revoked_at__gte=self._watermark - REFRESH_OVERLAP, expires_at__gt=now,
+        ).values_list('key', flat=True)
+        self._add_keys(list(keys))
+        self._watermark = now
+        self._refreshed_at = time.monotonic()
+
+    def _maybe_refresh(self):
+        elapsed = time.monotonic()
+        rebuild_due = self._bloom is None or elapsed - self._rebuilt_at >= _setting('REBUILD_SECONDS', 3600)
+        refresh_due = elapsed - self._refreshed_at >= _setting('REFRESH_SECONDS', 5)
+        if not (rebuild_due or refresh_due):
+            return
+        # Other requests keep using the current filter while one thread refreshes it.
+        if not self._refresh_lock.acquire(blocking=self._bloom is None):
+            return
+        try:
+            if self._bloom is None or rebuild_due:
+                self.rebuild()
+            elif refresh_due:
+                self.refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _revoked_at(self, key):
+        """When `key` was revoked, or None. Hits the LRU, then the database."""
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None:
+                self._lru.move_to_end(key)
+                return None if cached is _NOT_REVOKED else cached
+            generation = self._generation
+        revoked_at = (
+            RevokedToken.objects.filter(key=key, expires_at__gt=timezone.now())
+            .values_list('revoked_at', flat=True).first()
+        )
+        with self._lock:
+            if revoked_at is not None or generation == self._generation:
+                self._lru[key] = _NOT_REVOKED if revoked_at is None else revoked_at
+                while len(self._lru) > _setting('LRU_SIZE', 4096):
+                    self._lru.popitem(last=False)
+        return revoked_at
+
+    def is_revoked(self, payload):
+        """True if the token with this (already validated) payload has been revoked."""
+        self._maybe_refresh()
+        jti = payload.get(api_settings.JTI_CLAIM)
+        if jti and jti in self._bloom and self._revoked_at(jti) is not None:
+            return True
+        user_id = payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or user_key(user_id) not in self._bloom:
+            return False
+        revoked_at = self._revoked_at(user_key(user_id))
+        # `iat` has one-second resolution, so tokens issued in the same second as the revocation are rejected too.
+        return revoked_at is not None and payload.get('iat', 0) <= revoked_at.timestamp()
+
+    def add_local(self, key):
+        """Make a revocation made by this worker visible here immediately."""
+        if self._bloom is not None:
+            self._add_keys([key])
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._lru.clear()
+            self._refreshed_at = self._rebuilt_at = 0.0
+
+
+revocation_list = RevocationList()
+
+
+def is_revoked(payload):
+    return revocation_list.is_revoked(payload)
+
+
+def revoke_token(token):
+    """Revoke a single validated simplejwt token (refresh or access) until it expires."""
+    jti = token[api_settings.JTI_CLAIM]
+    RevokedToken.objects.get_or_create(key=jti, defaults={
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'expires_at': datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+    })
+    revocation_list.add_local(jti)
+
+
+def revoke_user_tokens(user):
+    """Revoke every token issued to `user` so far; tokens issued later are unaffected."""
+    now = timezone.now()
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    key = user_key(getattr(user, api_settings.USER_ID_FIELD))
+    RevokedToken.objects.update_or_create(key=key, defaults={
+        'user': user, 'revoked_at': now, 'expires_at': now + lifetime,
+    })
+    revocation_list.add_local(key)
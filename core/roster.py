@@ -0,0 +1,293 @@
+"""
+Semester roster import: bulk-provision student accounts from CSV or XLSX.
+
+Rows are streamed from the file and upserted by username in batches: one
+SELECT for the batch's existing users, then one `bulk_create` and one
+`bulk_update`. New accounts get an unusable password, which costs no
+hashing. Each student instead receives an invitation (a password-reset
+style token that stays valid for ROSTER_INVITATION_TIMEOUT_DAYS) and sets a
+password through /api/users/accept-invitation/, so the PBKDF2 cost is paid
+once per student, when they first sign in, rather than 30k times during the
+import. Students who let their invitation expire are sent a new one by
+`manage.py resend_invitations` (`pending_invitations` finds them).
+
+Every username in the file is recorded in `RosterImportEntry`. With
+`deactivate_missing`, active students with no entry are deactivated by a
+single UPDATE with an anti-join. Entries are only working state: those of
+existing accounts are deleted when the import finishes, those of new
+accounts once their invitations are sent, and anything left over after
+ROSTER_ENTRY_RETENTION_DAYS when the next import starts.
+
+The invitation link points at ROSTER_INVITATION_URL, a page of the
+patron-facing site that POSTs the password to the API; it must be set
+before invitations can be sent.
+"""
+import csv
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage, get_connection
+from django.core.validators import validate_email
+from django.db import transaction as db_transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.crypto import constant_time_compare
+from django.utils.http import base36_to_int, urlsafe_base64_encode
+
+from .models import User, RosterImport, RosterImportEntry
+
+ROSTER_FIELDS = ['email', 'first_name', 'last_name', 'user_type']
+USER_TYPES = {value for value, _ in User.USER_TYPE_CHOICES}
+MAX_STORED_ERRORS = 100
+
+
+class RosterError(ValueError):
+    pass
+
+
+def _xlsx_rows(fileobj):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for values in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in values]
+    finally:
+        workbook.close()
+
+
+def read_roster(fileobj, filename):
+    """
+    Yields (line_number, row dict) from a CSV or XLSX roster. The first row
+    is the header; column names are matched case-insensitively.
+    """
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(fileobj)
+    else:
+        rows = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    header = [name.strip().lower().replace(' ', '_') for name in next(rows, [])]
+    if 'username' not in header:
+        raise RosterError("The roster needs a 'username' column.")
+    for line, values in enumerate(rows, start=2):
+        if any(value.strip() for value in values):
+            yield line, dict(zip(header, (value.strip() for value in values)))
+
+
+def clean_row(row, default_user_type='student'):
+    """Returns the user fields for a roster row, or raises RosterError."""
+    username = row.get('username', '')
+    if not username:
+        raise RosterError("Missing username.")
+    email = row.get('email', '').lower()
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise RosterError(f"Invalid email '{email}'.")
+    user_type = row.get('user_type', '').lower() or default_user_type
+    if user_type not in USER_TYPES:
+        raise RosterError(f"Unknown user_type '{user_type}'.")
+    return {
+        'username': username,
+        'email': email,
+        'first_name': row.get('first_name', ''),
+        'last_name': row.get('last_name', ''),
+        'user_type': user_type,
+    }
+
+
+def _apply_batch(roster_import, batch):
+    """Upsert one batch of cleaned rows and record their entries. Returns (created, updated)."""
+    existing = {user.username: user for user in User.objects.filter(username__in=[row['username'] for row in batch])}
+    to_create, to_update, entries = [], [], []
+    for row in batch:
+        user = existing.get(row['username'])
+        if user is None:
+            to_create.append(User(password=make_password(None), is_active=True, **row))
+        elif not user.is_active or any(getattr(user, field) != row[field] for field in ROSTER_FIELDS):
+            for field in ROSTER_FIELDS:
+                setattr(user, field, row[field])
+            user.is_active = True # Students back on the roster are reactivated
+            to_update.append(user)
+        entries.append(RosterImportEntry(roster_import=roster_import, username=row['username'], created=user is None))
+
+    with db_transaction.atomic():
+        User.objects.bulk_create(to_create)
+        User.objects.bulk_update(to_update, ROSTER_FIELDS + ['is_active'])
+        RosterImportEntry.objects.bulk_create(entries)
+    return len(to_create), len(to_update)
+
+
+def _save_progress(roster_import, rows, created, updated, errors):
+    roster_import.errors = (roster_import.errors + errors)[:MAX_STORED_ERRORS]
+    RosterImport.objects.filter(pk=roster_import.pk).update(
+        rows_processed=F('rows_processed') + rows,
+        created_count=F('created_count') + created,
+        updated_count=F('updated_count') + updated,
+        error_count=F('error_count') + len(errors),
+        errors=roster_import.errors,
+    )
+
+
+def missing_students(roster_import):
+    """Active students (not staff accounts) whose username is not in the roster."""
+    listed = RosterImportEntry.objects.filter(roster_import=roster_import, username=OuterRef('username'))
+    return User.objects.filter(user_type='student', is_active=True, is_staff=False, is_superuser=False).filter(~Exists(listed))
+
+
+def prune_entries(now=None):
+    """Deletes the entries of imports that started more than ROSTER_ENTRY_RETENTION_DAYS ago. Returns the count."""
+    cutoff = (now or timezone.now()) - timedelta(days=getattr(settings, 'ROSTER_ENTRY_RETENTION_DAYS', 7))
+    deleted, _ = RosterImportEntry.objects.filter(roster_import__started_at__lt=cutoff).delete()
+    return deleted
+
+
+def import_roster(rows, filename='', started_by=None, batch_size=None, deactivate_missing=False,
+                  default_user_type='student', progress=None):
+    """
+    Upserts users from (line, row) pairs as produced by `read_roster`.
+    `progress(roster_import)` is called after every batch. Missing students
+    are only deactivated if every row imported cleanly.
+    """
+    batch_size = batch_size or getattr(settings, 'ROSTER_IMPORT_BATCH_SIZE', 1000)
+    prune_entries()
+    roster_import = RosterImport.objects.create(filename=filename, started_by=started_by)
+    seen = set()
+    batch, errors = [], []
+
+    def flush():
+        created, updated = _apply_batch(roster_import, batch) if batch else (0, 0)
+        _save_progress(roster_import, len(batch) + len(errors), created, updated, errors)
+        batch.clear()
+        errors.clear()
+        roster_import.refresh_from_db()
+        if progress:
+            progress(roster_import)
+
+    try:
+        for line, row in rows:
+            try:
+                cleaned = clean_row(row, default_user_type)
+                if cleaned['username'] in seen:
+                    raise RosterError(f"Duplicate username '{cleaned['username']}'.")
+            except RosterError as e:
+                errors.append({'line': line, 'error': str(e)})
+            else:
+                seen.add(cleaned['username'])
+                batch.append(cleaned)
+            if len(batch) + len(errors) >= batch_size:
+                flush()
+        flush()
+
+        if deactivate_missing and roster_import.error_count == 0 and seen:
+            roster_import.deactivated_count = missing_students(roster_import).update(is_active=False)
+        roster_import.status = 'finished'
+    except Exception:
+        roster_import.status = 'failed'
+        raise
+    finally:
+        roster_import.finished_at = timezone.now()
+        roster_import.save(update_fields=['status', 'deactivated_count', 'finished_at'])
+        # Only new accounts' entries are still needed, by send_invitations.
+        RosterImportEntry.objects.filter(roster_import=roster_import, created=False).delete()
+    return roster_import
+
+
+class InvitationTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Password reset tokens with their own salt (a reset token is not an
+    invitation) and ROSTER_INVITATION_TIMEOUT_DAYS instead of
+    PASSWORD_RESET_TIMEOUT, which is too short for a term start.
+    """
+    key_salt = 'core.roster.InvitationTokenGenerator'
+
+    def check_token(self, user, token):
+        if not (user and token):
+            return False
+        try:
+            timestamp = base36_to_int(token.split('-')[0])
+        except ValueError:
+            return False
+        timeout = getattr(settings, 'ROSTER_INVITATION_TIMEOUT_DAYS', 30) * 24 * 60 * 60
+        if self._num_seconds(self._now()) - timestamp > timeout:
+            return False
+        return any(
+            constant_time_compare(self._make_token_with_timestamp(user, timestamp, secret), token)
+            for secret in [self.secret, *self.secret_fallbacks]
+        )
+
+
+invitation_token_generator = InvitationTokenGenerator()
+
+
+def invitation_token(user):
+    """(uid, token) for /api/users/accept-invitation/; the token stops working once a password is set."""
+    return urlsafe_base64_encode(force_bytes(user.pk)), invitation_token_generator.make_token(user)
+
+
+def invitation_url():
+    """ROSTER_INVITATION_URL, or RosterError if it is not configured."""
+    url = getattr(settings, 'ROSTER_INVITATION_URL', '')
+    if not url:
+        raise RosterError(
+            "Set ROSTER_INVITATION_URL to the page where invited students choose a password before sending invitations."
+        )
+    return url
+
+
+def build_invitation(user):
+    uid, token = invitation_token(user)
+    url = invitation_url()
+    body = (
+        f"Hello {user.first_name or user.username},\n\n"
+        f"A library account has been created for you (username: {user.username}).\n"
+        f"To choose your password, go to {url}?uid={uid}&token={token}\n\n"
+        "Thank you,\nThe Library"
+    )
+    return EmailMessage("Your library account", body, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+def _send(users, batch_size, connection):
+    invitation_url()
+    users = users.exclude(email='').order_by('pk')
+    connection = connection or get_connection()
+    sent, messages = 0, []
+    connection.open()
+    try:
+        for user in users.iterator(chunk_size=batch_size):
+            messages.append(build_invitation(user))
+            if len(messages) >= batch_size:
+                sent += connection.send_messages(messages) or 0
+                messages.clear()
+        if messages:
+            sent += connection.send_messages(messages) or 0
+    finally:
+        connection.close()
+    return sent
+
+
+def send_invitations(roster_import, batch_size=500, connection=None):
+    """
+    Email an invitation to every account created by `roster_import` that
+    has an email address, then drop the import's entries. Returns the count.
+    """
+    created = RosterImportEntry.objects.filter(roster_import=roster_import, created=True, username=OuterRef('username'))
+    sent = _send(User.objects.filter(Exists(created)), batch_size, connection)
+    RosterImportEntry.objects.filter(roster_import=roster_import).delete()
+    return sent
+
+
+def pending_invitations():
+    """Active accounts that have never set a password (roster imports create them that way)."""
+    return User.objects.filter(is_active=True, password__startswith=UNUSABLE_PASSWORD_PREFIX)
+
+
+def resend_invitations(users=None, batch_size=500, connection=None):
+    """Email a new invitation to `users` (default: all `pending_invitations`) that have an email address. Returns the count."""
+    return _send(pending_invitations() if users is None else users, batch_size, connection)
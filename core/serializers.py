@@ -1,5 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
 from rest_framework import serializers
-from .models import User, Book, Transaction, Fee # Import all models that might need serialization
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import User, Book, BookTombstone, BookRecommendation, Transaction, Fee, Stocktake, RosterImport # Import all models that might need serialization
+from .covers import cover_urls
+from .revocation import is_revoked, revoke_token
+from .roster import invitation_token_generator, invitation_url, RosterError
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,11 +21,23 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'date_joined', 'last_login']
 
 class BookSerializer(serializers.ModelSerializer):
+    cover_thumbnails = serializers.SerializerMethodField() # Locally cached cover URLs by size, or null
+
     class Meta:
         model = Book
         fields = '__all__' # Includes all fields from the Book model
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_cover_thumbnails(self, book):
+        return cover_urls(book, self.context.get('request'))
+
+class BookTombstoneSerializer(serializers.ModelSerializer): # Deleted books in the change feed
+    id = serializers.UUIDField(source='book_id')
+
+    class Meta:
+        model = BookTombstone
+        fields = ['id', 'isbn', 'deleted_at']
+
 class TransactionSerializer(serializers.ModelSerializer):
     # Optionally, use nested serializers for better representation of related objects
     # user = UserSerializer(read_only=True) # Example of nested read-only user
@@ -50,7 +75,7 @@ class FeeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Fee
         fields = '__all__'
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'archived_transaction', 'created_at', 'updated_at'] # archived_transaction is set by the archival job
 
 # More specific serializers can be created later, e.g., for checkout/return operations.
 class BookSearchSerializer(serializers.ModelSerializer): # For book search results
@@ -58,6 +83,13 @@ class BookSearchSerializer(serializers.ModelSerializer): # For book search resul
         model = Book
         fields = ['id', 'title', 'authors', 'isbn', 'category', 'status']
 
+class RelatedBookSerializer(serializers.ModelSerializer): # "Also borrowed" entries for /api/books/{id}/related/
+    book = BookSearchSerializer(source='related_book', read_only=True)
+
+    class Meta:
+        model = BookRecommendation
+        fields = ['book', 'co_borrowers']
+
 class TransactionCreateSerializer(serializers.ModelSerializer): # For creating transactions
     class Meta:
         model = Transaction
@@ -68,7 +100,7 @@ class TransactionCreateSerializer(serializers.ModelSerializer): # For creating t
         transaction = super().create(validated_data)
         if transaction.transaction_type == 'checkout':
             transaction.book.status = 'borrowed'
-            transaction.book.save(update_fields=['status'])
+            transaction.book.save(update_fields=['status', 'updated_at']) # updated_at feeds the catalog change feed
         # Add logic for 'return' if this serializer is also used for returns,
         # or use a different serializer for returns.
         return transaction
@@ -85,13 +117,13 @@ class TransactionReturnSerializer(serializers.ModelSerializer):
         instance.return_date = validated_data.get('return_date', timezone.now())
         instance.transaction_type = 'return' # Ensure type is set to return
         instance.book.status = 'available'
-        instance.book.save(update_fields=['status'])
+        instance.book.save(update_fields=['status', 'updated_at'])
 
         # Basic overdue fee calculation
         # This should be more robust, potentially in a service or model method
         if instance.due_date and instance.return_date.date() > instance.due_date:
             overdue_days = (instance.return_date.date() - instance.due_date).days
-            fee_amount = overdue_days * 0.50 # $0.50 per day
+            fee_amount = Fee.overdue_amount(overdue_days)
             if fee_amount > 0:
                 Fee.objects.create(
                     user=instance.user,
@@ -102,3 +134,94 @@ class TransactionReturnSerializer(serializers.ModelSerializer):
                     notes=f"Overdue by {overdue_days} day(s)."
                 )
         return super().update(instance, validated_data)
+
+
+class RevocationCheckingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    /api/token/refresh/: refuses revoked refresh tokens, and revokes the old
+    one on rotation when BLACKLIST_AFTER_ROTATION is set.
+    """
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh.payload):
+            raise InvalidToken({'detail': 'Token has been revoked.', 'code': 'token_revoked'})
+        data = super().validate(attrs)
+        if jwt_settings.ROTATE_REFRESH_TOKENS and jwt_settings.BLACKLIST_AFTER_ROTATION:
+            revoke_token(refresh)
+        return data
+
+class LogoutSerializer(serializers.Serializer): # For /api/token/logout/
+    refresh = serializers.CharField()
+    everywhere = serializers.BooleanField(default=False) # Also revoke every other token of this user
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+
+class StocktakeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Stocktake
+        fields = ['id', 'name', 'status', 'started_by', 'scan_count', 'lost_count', 'created_at', 'confirmed_at']
+        read_only_fields = ['id', 'status', 'started_by', 'scan_count', 'lost_count', 'created_at', 'confirmed_at']
+
+class StocktakeScansSerializer(serializers.Serializer): # One chunk of scanned barcodes
+    isbns = serializers.ListField(child=serializers.CharField(max_length=32), allow_empty=False,
+                                  max_length=getattr(settings, 'STOCKTAKE_MAX_CHUNK', 10000))
+
+class StocktakeConfirmSerializer(serializers.Serializer):
+    expected_missing = serializers.IntegerField(required=False, min_value=0) # Missing count from the reviewed report
+
+class RosterImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RosterImport
+        fields = '__all__'
+        read_only_fields = [field.name for field in RosterImport._meta.fields]
+
+class RosterUploadSerializer(serializers.Serializer): # multipart upload for POST /api/roster-imports/
+    file = serializers.FileField()
+    deactivate_missing = serializers.BooleanField(default=False) # Deactivate active students not in this roster
+    send_invitations = serializers.BooleanField(default=False) # Email new accounts a link to set their password
+    default_user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, default='student')
+
+    def validate_file(self, value):
+        if not value.name.lower().endswith(('.csv', '.xlsx')):
+            raise serializers.ValidationError("Upload a .csv or .xlsx file.")
+        return value
+
+    def validate_send_invitations(self, value):
+        if value:
+            try:
+                invitation_url() # Checked before importing, not after the accounts exist
+            except RosterError as e:
+                raise serializers.ValidationError(str(e))
+        return value
+
+class AcceptInvitationSerializer(serializers.Serializer):
+    uid = serializers.CharField()
+    token = serializers.CharField()
+    password = serializers.CharField(write_only=True, style={'input_type': 'password'})
+
+    def validate(self, attrs):
+        try:
+            user = User.objects.get(pk=force_str(urlsafe_base64_decode(attrs['uid'])), is_active=True)
+        except (User.DoesNotExist, ValueError, TypeError, OverflowError):
+            user = None
+        if user is None or not invitation_token_generator.check_token(user, attrs['token']):
+            raise serializers.ValidationError("Invalid or expired invitation.")
+        try:
+            validate_password(attrs['password'], user)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'password': list(e.messages)})
+        attrs['user'] = user
+        return attrs
+
+class CoverIngestSerializer(serializers.Serializer): # POST /api/books/{id}/cover/
+    url = serializers.URLField(required=False)
+    file = serializers.FileField(required=False)
+
+    def validate(self, attrs):
+        if ('url' in attrs) == ('file' in attrs):
+            raise serializers.ValidationError("Send either a cover `url` or an uploaded `file`.")
+        return attrs
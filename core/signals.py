@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .covers import CoverError, ingest_url, needs_ingest
+from .facets import bump_catalog_version
+from .models import Book, BookTombstone, CatalogSequence
+
+
+@receiver(pre_delete, sender=Book)
+def number_book_deletion(sender, instance, **kwargs):
+    """Take the change number before the row is locked by the DELETE, like every other catalog write."""
+    instance._deletion_change_seq = CatalogSequence.next_value()
+
+
+@receiver(post_delete, sender=Book)
+def record_book_tombstone(sender, instance, **kwargs):
+    """Keep a tombstone so the change feed can report the deletion."""
+    BookTombstone.objects.update_or_create(book_id=instance.pk, defaults={
+        'isbn': instance.isbn, 'deleted_at': timezone.now(), 'change_seq': instance._deletion_change_seq,
+    })
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalog_facets(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Book)
+def ingest_cover_image(sender, instance, update_fields=None, **kwargs):
+    """Queue a local copy of a new or changed `cover_image_url` (see core/covers.py)."""
+    if update_fields is not None and 'cover_image_url' not in update_fields:
+        return # e.g. status changes on checkout/return
+    if needs_ingest(instance):
+        try:
+            ingest_url(instance, instance.cover_image_url)
+        except CoverError:
+            pass # Not an http(s) URL; clients keep using cover_image_url as before
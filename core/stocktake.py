@@ -0,0 +1,111 @@
+"""
+Annual stocktake: reconcile scanned shelf barcodes against the catalog.
+
+Scanned ISBNs are uploaded in chunks and bulk-inserted into `StocktakeScan`.
+The comparison never loops over scans. Each section of the report is one
+anti-join or semi-join between the scans (indexed on (stocktake, isbn)) and
+`Book.isbn` (unique), so the database does the set difference:
+
+* missing: books marked available that were not scanned
+* scanned_borrowed / scanned_lost: books on the shelf that the catalog says are out
+* unknown: scanned ISBNs that match no book
+
+Confirming the stocktake marks every missing book lost with one UPDATE.
+"""
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .facets import bump_catalog_version
+from .models import Book, Stocktake, StocktakeScan
+
+INSERT_BATCH_SIZE = 5000
+
+
+class StocktakeError(ValueError):
+    pass
+
+
+def normalize_isbn(value):
+    """Strip hyphens and spaces from a scanned barcode; None if it can't be an ISBN."""
+    isbn = str(value).replace('-', '').replace(' ', '').strip().upper()
+    return isbn if 0 < len(isbn) <= 13 else None
+
+
+def add_scans(stocktake, values):
+    """Stage a chunk of scanned barcodes. Returns (accepted, rejected values)."""
+    if stocktake.status != 'open':
+        raise StocktakeError(f"Stocktake is {stocktake.status}; scans can only be added while it is open.")
+    scans, rejected = [], []
+    for value in values:
+        isbn = normalize_isbn(value)
+        if isbn is None:
+            rejected.append(value)
+        else:
+            scans.append(StocktakeScan(stocktake=stocktake, isbn=isbn))
+    with db_transaction.atomic():
+        StocktakeScan.objects.bulk_create(scans, batch_size=INSERT_BATCH_SIZE)
+        Stocktake.objects.filter(pk=stocktake.pk).update(scan_count=F('scan_count') + len(scans))
+    stocktake.refresh_from_db(fields=['scan_count'])
+    return len(scans), rejected
+
+
+def _scanned(stocktake):
+    return Exists(StocktakeScan.objects.filter(stocktake=stocktake, isbn=OuterRef('isbn')))
+
+
+def missing_books(stocktake):
+    """Books marked available that were not scanned."""
+    return Book.objects.filter(status='available').filter(~_scanned(stocktake))
+
+
+def compare(stocktake, sample_size=None):
+    """Counts plus a sample of rows for each section of the report."""
+    sample_size = sample_size or getattr(settings, 'STOCKTAKE_SAMPLE_SIZE', 50)
+    scanned_books = Book.objects.filter(_scanned(stocktake))
+    sections = {
+        'missing': missing_books(stocktake),
+        'scanned_borrowed': scanned_books.filter(status='borrowed'),
+        'scanned_lost': scanned_books.filter(status='lost'),
+    }
+    scans = StocktakeScan.objects.filter(stocktake=stocktake)
+    unknown = scans.filter(~Exists(Book.objects.filter(isbn=OuterRef('isbn')))).values('isbn').distinct()
+
+    report = {
+        'scan_count': stocktake.scan_count,
+        'distinct_isbns': scans.values('isbn').distinct().count(),
+    }
+    for name, queryset in sections.items():
+        report[name] = {
+            'count': queryset.count(),
+            'sample': list(queryset.order_by('isbn').values('id', 'isbn', 'title', 'status')[:sample_size]),
+        }
+    report['unknown'] = {
+        'count': unknown.count(),
+        'sample': list(unknown.order_by('isbn').values_list('isbn', flat=True)[:sample_size]),
+    }
+    return report
+
+
+def mark_missing_lost(stocktake, expected_missing=None):
+    """
+    Confirm the stocktake: mark every missing book lost in a single UPDATE.
+    If `expected_missing` (the count the librarian reviewed) no longer
+    matches, nothing is changed.
+    """
+    with db_transaction.atomic():
+        stocktake = Stocktake.objects.select_for_update().get(pk=stocktake.pk)
+        if stocktake.status != 'open':
+            raise StocktakeError(f"Stocktake is already {stocktake.status}.")
+        missing = missing_books(stocktake)
+        if expected_missing is not None and missing.count() != expected_missing:
+            raise StocktakeError("The missing books changed since the report was reviewed; compare again before confirming.")
+        now = timezone.now()
+        # update() skips signals: update_changed() stamps the change feed, and the facet cache is bumped below.
+        stocktake.lost_count = missing.update_changed(status='lost')
+        stocktake.status = 'confirmed'
+        stocktake.confirmed_at = now
+        stocktake.save(update_fields=['lost_count', 'status', 'confirmed_at'])
+    bump_catalog_version()
+    return stocktake
@@ -0,0 +1,78 @@
+"""
+Catalog change feed for offline clients (kiosks, mobile app).
+
+A sync token encodes the (change_seq, id) of the last change a client has
+seen. Every catalog write takes its change_seq from `CatalogSequence` inside
+its own transaction, and the counter row stays locked until that
+transaction commits, so changes become visible in change_seq order: a
+write can never commit behind a token that was already handed out, however
+long its transaction runs. Books are ordered by (change_seq, id) and
+deletions by (change_seq, book_id); both are backed by composite indexes,
+so a sync with nothing new is one index probe per table.
+"""
+import base64
+import uuid
+
+from .models import Book, BookTombstone
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_token(change_seq, pk):
+    raw = f"{change_seq}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Returns (change_seq, uuid) or raises InvalidSyncToken."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        change_seq, pk = raw.split('|')
+        return int(change_seq), uuid.UUID(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidSyncToken('Malformed sync token.') from exc
+
+
+def _after(queryset, seq_field, id_field, position):
+    """Rows strictly after `position` in (seq_field, id_field) order."""
+    if position is None:
+        return queryset
+    change_seq, pk = position
+    return queryset.filter(**{f'{seq_field}__gte': change_seq}).exclude(
+        **{seq_field: change_seq, f'{id_field}__lte': pk}
+    )
+
+
+def fetch_changes(token=None, limit=500):
+    """
+    Returns (books, tombstones, next_token, has_more) for everything changed
+    after `token` (from the beginning when None), at most `limit` items.
+    """
+    position = decode_token(token) if token else None
+
+    books = list(
+        _after(Book.objects.select_related('cover'), 'change_seq', 'id', position)
+        .order_by('change_seq', 'id')[:limit + 1]
+    )
+    tombstones = list(
+        _after(BookTombstone.objects.all(), 'change_seq', 'book_id', position)
+        .order_by('change_seq', 'book_id')[:limit + 1]
+    )
+
+    events = sorted(
+        [((book.change_seq, book.id), book) for book in books]
+        + [((tombstone.change_seq, tombstone.book_id), tombstone) for tombstone in tombstones],
+        key=lambda event: event[0],
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    next_token = encode_token(*events[-1][0]) if events else token
+    return (
+        [obj for _, obj in events if isinstance(obj, Book)],
+        [obj for _, obj in events if isinstance(obj, BookTombstone)],
+        next_token,
+        has_more,
+    )
@@ -1,3 +1,921 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction as db_transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import Workbook
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    User, Book, BookCover, Transaction, TransactionArchive, LoanNotice, BookRecommendation, RevokedToken, Fee,
+    RosterImportEntry,
+)
+from . import barcodes, covers
+from .archive import archive_cutoff, archive_transactions
+from .consistency import repair_inconsistencies
+from .facets import _grouped_counts, _grouping_sets_counts
+from .filters import TransactionFilter
+from .loadtest import check_invariants, setup_fixtures
+from .recommendations import rebuild_recommendations, update_recommendations
+from .revocation import revocation_list
+from .roster import invitation_token
+from .serializers import TransactionCreateSerializer
+
+
+def fake_cover_fetcher(url):
+    """Stand-in for covers.fetch_url: a generated JPEG, or an error for URLs containing 'missing'."""
+    from PIL import Image
+
+    if 'missing' in url:
+        raise OSError("404 Not Found")
+    buffer = BytesIO()
+    Image.new('RGB', (600, 900), tuple(hashlib.sha256(url.encode()).digest()[:3])).save(buffer, 'JPEG') # Colour differs per URL
+    return buffer.getvalue(), 'image/jpeg'
+
+
+
+class TransactionArchiveTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.book = Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert')
+        now = timezone.now()
+        self.old_loans = [
+            Transaction.objects.create(user=self.admin, book=self.book, transaction_type='return',
+                                       transaction_date=now - timedelta(days=days + 14), due_date=(now - timedelta(days=days)).date(),
+                                       return_date=now - timedelta(days=days))
+            for days in (400, 420, 430)
+        ]
+        self.fee = Fee.objects.create(user=self.admin, book=self.book, transaction=self.old_loans[0], amount='2.00')
+        self.recent = Transaction.objects.create(user=self.admin, book=self.book, transaction_type='return',
+                                                 return_date=now - timedelta(days=3))
+        self.open_loan = Transaction.objects.create(user=self.admin, book=self.book, transaction_type='checkout')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_archive_moves_old_returns_and_repoints_fees(self):
+        self.assertEqual(archive_transactions(batch_size=2), 3)
+        self.assertEqual(archive_transactions(), 0)
+        self.assertEqual(set(Transaction.objects.values_list('pk', flat=True)), {self.recent.pk, self.open_loan.pk})
+        self.assertEqual(set(TransactionArchive.objects.values_list('pk', flat=True)), {loan.pk for loan in self.old_loans})
+
+        self.fee.refresh_from_db()
+        self.assertIsNone(self.fee.transaction)
+        self.assertEqual(self.fee.archived_transaction.pk, self.old_loans[0].pk)
+        self.assertEqual(self.fee.archived_transaction.return_date, self.old_loans[0].return_date)
+        self.assertEqual(TransactionArchive.objects.get(pk=self.old_loans[0].pk).fee_record, self.fee)
+
+    def test_list_reaches_archive_only_when_date_filter_does(self):
+        archive_transactions()
+        response = self.client.get('/api/transactions/')
+        self.assertEqual({row['id'] for row in response.json()['results']}, {str(self.recent.pk), str(self.open_loan.pk)})
+
+        after = (timezone.now() - timedelta(days=440)).isoformat()
+        response = self.client.get('/api/transactions/', {'transaction_date_after': after, 'ordering': 'transaction_date'})
+        ids = [row['id'] for row in response.json()['results']]
+        self.assertEqual(ids, [str(self.old_loans[1].pk), str(self.old_loans[0].pk), str(self.recent.pk), str(self.open_loan.pk)])
+
+        before = (timezone.now() - timedelta(days=440)).isoformat()
+        response = self.client.get('/api/transactions/', {'transaction_date_before': before})
+        self.assertEqual([row['id'] for row in response.json()['results']], [str(self.old_loans[2].pk)])
+
+    def test_reaches_archive(self):
+        cutoff = archive_cutoff()
+
+        def reaches(**params):
+            return TransactionFilter(params, queryset=TransactionArchive.objects.all()).reaches_archive(cutoff)
+
+        self.assertFalse(reaches())
+        self.assertFalse(reaches(transaction_type='return'))
+        self.assertFalse(reaches(transaction_date_after=(cutoff + timedelta(days=1)).isoformat()))
+        self.assertTrue(reaches(transaction_date_after=(cutoff - timedelta(days=1)).isoformat()))
+        self.assertTrue(reaches(transaction_date_before=timezone.now().isoformat()))
+        self.assertFalse(reaches(transaction_date_after='not a date'))
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.book = Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert',
+                                        description='A very long description.')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_book_list_sql(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/books/{query}')
+        select = next(q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'COUNT(' not in q['sql'])
+        return response, select
+
+    def test_fields_trims_payload_and_columns(self):
+        response, sql = self.get_book_list_sql('?fields=id,title')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"authors"', sql)
+
+    def test_exclude_defers_columns(self):
+        response, sql = self.get_book_list_sql('?exclude=description')
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results'][0]
+        self.assertNotIn('description', result)
+        self.assertEqual(result['authors'], 'Frank Herbert')
+        self.assertNotIn('"description"', sql)
+
+    def test_detail_and_search_action(self):
+        response = self.client.get(f'/api/books/{self.book.pk}/?fields=isbn')
+        self.assertEqual(response.json(), {'isbn': '9780000000001'})
+        response = self.client.get('/api/books/search/?title=dune&fields=title,status')
+        self.assertEqual(response.json()['results'], [{'title': 'Dune', 'status': 'available'}])
+
+    def test_related_fields_on_other_viewsets(self):
+        response = self.client.get('/api/users/?fields=username,user_type')
+        self.assertEqual(response.json()['results'], [{'username': 'librarian', 'user_type': 'student'}])
+        response = self.client.get('/api/fees/?fields=user,amount')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/books/?fields=title,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+        # search action only allows BookSearchSerializer fields
+        response = self.client.get('/api/books/search/?exclude=description')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exclude', response.json())
+
+
+class BookChangeFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.first = Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert')
+        self.second = Book.objects.create(isbn='9780000000002', title='Emma', authors='Jane Austen')
+
+    def test_paged_sync_then_delta_and_tombstone(self):
+        response = self.client.get('/api/books/changes/?limit=1')
+        self.assertEqual([b['isbn'] for b in response.json()['changed']], ['9780000000001'])
+        self.assertTrue(response.json()['has_more'])
+        token = response.json()['next_token']
+
+        response = self.client.get(f'/api/books/changes/?since={token}')
+        self.assertEqual([b['isbn'] for b in response.json()['changed']], ['9780000000002'])
+        self.assertFalse(response.json()['has_more'])
+        token = response.json()['next_token']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/books/changes/?since={token}')
+        self.assertEqual(response.json()['changed'], [])
+        self.assertEqual(response.json()['next_token'], token)
+        self.assertEqual(len(ctx.captured_queries), 2) # one probe each for books and tombstones
+
+        self.first.title = 'Dune Messiah'
+        self.first.save()
+        deleted_id = self.second.pk
+        self.second.delete()
+        response = self.client.get(f'/api/books/changes/?since={token}').json()
+        self.assertEqual([b['title'] for b in response['changed']], ['Dune Messiah'])
+        self.assertEqual(response['deleted'][0]['id'], str(deleted_id))
+
+    def test_malformed_token(self):
+        self.assertEqual(self.client.get('/api/books/changes/?since=garbage').status_code, 400)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs a database where concurrent writers wait on row locks')
+class BookChangeFeedCommitOrderTests(TransactionTestCase):
+    def sync(self, token=None):
+        return self.client.get('/api/books/changes/', {'since': token} if token else {}).json()
+
+    def test_slow_committing_write_is_not_skipped(self):
+        self.client = APIClient()
+        slow = Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert')
+        token = self.sync()['next_token']
+        numbered, release = threading.Event(), threading.Event()
+
+        def slow_write():
+            # Stamped first, committed last: this is what a timestamp-ordered feed would skip.
+            with db_transaction.atomic():
+                Book.objects.filter(pk=slow.pk).update_changed(title='Dune Messiah')
+                numbered.set()
+                release.wait(5)
+            connection.close()
+
+        def fast_write():
+            Book.objects.create(isbn='9780000000002', title='Emma', authors='Jane Austen')
+            connection.close()
+
+        writers = [threading.Thread(target=slow_write), threading.Thread(target=fast_write)]
+        writers[0].start()
+        numbered.wait(5)
+        writers[1].start()
+        writers[1].join(0.5)
+        self.assertTrue(writers[1].is_alive()) # Queued behind the slow transaction on the counter row
+        self.assertEqual(self.sync(token)['changed'], [])
+
+        release.set()
+        for writer in writers:
+            writer.join(5)
+        self.assertEqual([book['title'] for book in self.sync(token)['changed']], ['Dune Messiah', 'Emma'])
+
+
+class LoanNoticeTests(TestCase):
+    def setUp(self):
+        today = timezone.localdate()
+        self.patron = User.objects.create_user('patron', 'patron@library.local', 'password', first_name='Ada')
+        no_email = User.objects.create_user('noemail', '', 'password')
+        books = [Book.objects.create(isbn=f'97800000000{i:02d}', title=f'Book {i}', authors='A') for i in range(5)]
+        Transaction.objects.create(user=self.patron, book=books[0], transaction_type='checkout', due_date=today + timedelta(days=3))
+        Transaction.objects.create(user=self.patron, book=books[1], transaction_type='checkout', due_date=today - timedelta(days=2))
+        Transaction.objects.create(user=self.patron, book=books[2], transaction_type='checkout', due_date=today + timedelta(days=10))
+        Transaction.objects.create(user=self.patron, book=books[3], transaction_type='checkout', due_date=today - timedelta(days=5),
+                                   return_date=timezone.now())
+        Transaction.objects.create(user=no_email, book=books[4], transaction_type='checkout', due_date=today - timedelta(days=1))
+
+    def test_one_digest_per_patron_and_rerun_is_idempotent(self):
+        call_command('send_loan_notices', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patron@library.local'])
+        self.assertIn('Book 0', mail.outbox[0].body)
+        self.assertIn('Book 1', mail.outbox[0].body)
+        self.assertNotIn('Book 2', mail.outbox[0].body)
+        self.assertEqual(LoanNotice.objects.count(), 2)
+
+        call_command('send_loan_notices', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class BookFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert', category='Sci-Fi', language='en')
+        Book.objects.create(isbn='9780000000002', title='Solaris', authors='Stanislaw Lem', category='Sci-Fi', language='pl')
+        Book.objects.create(isbn='9780000000003', title='Emma', authors='Jane Austen', category='Classic', language='en')
+
+    def test_facets_follow_filters_and_are_cached(self):
+        facets = self.client.get('/api/books/?language=en').json()['facets']
+        self.assertEqual(facets['category'], [{'value': 'Classic', 'count': 1}, {'value': 'Sci-Fi', 'count': 1}])
+        self.assertEqual(facets['status'], [{'value': 'available', 'count': 2}])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/books/?language=en&page=1')
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in ctx.captured_queries))
+
+        Book.objects.create(isbn='9780000000004', title='Persuasion', authors='Jane Austen', category='Classic', language='en')
+        facets = self.client.get('/api/books/?language=en').json()['facets']
+        self.assertEqual(facets['category'][0], {'value': 'Classic', 'count': 2})
+
+    def test_search_facets_and_opt_out(self):
+        facets = self.client.get('/api/books/search/?author=austen').json()['facets']
+        self.assertEqual(facets['language'], [{'value': 'en', 'count': 1}])
+        self.assertNotIn('facets', self.client.get('/api/books/?facets=false').json())
+
+    @skipUnless(connection.vendor == 'postgresql', 'GROUPING SETS path is PostgreSQL-only')
+    def test_grouping_sets_match_grouped_counts(self):
+        for i in range(4):
+            Book.objects.create(isbn=f'97800000001{i:02d}', title=f'Book {i}', authors='A', category='Poetry', language='')
+        fields = ['category', 'status', 'language']
+        with CaptureQueriesContext(connection) as ctx:
+            combined = _grouping_sets_counts(Book.objects.all(), fields, 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(combined, _grouped_counts(Book.objects.all(), fields, 2))
+        self.assertEqual(combined['category'], [('Poetry', 4), ('Sci-Fi', 2)])
+        self.assertEqual(combined['language'], [('', 4), ('en', 2)])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(isbn=f'97800000000{i:02d}', title=f'Book {i}', authors='A') for i in range(4)]
+        self.patrons = [User.objects.create_user(f'patron{i}', f'p{i}@library.local', 'password') for i in range(3)]
+
+    def borrow(self, patron, *books):
+        for book in books:
+            Transaction.objects.create(user=self.patrons[patron], book=self.books[book], transaction_type='return',
+                                       return_date=timezone.now())
+
+    def related(self, book):
+        return [(self.books.index(Book.objects.get(pk=r['book']['id'])), r['co_borrowers'])
+                for r in APIClient().get(f'/api/books/{self.books[book].pk}/related/').json()]
+
+    def test_full_build_and_endpoint(self):
+        self.borrow(0, 0, 1, 2)
+        self.borrow(1, 0, 1)
+        self.borrow(2, 0, 3, 0) # repeat borrowings count once
+        rebuild_recommendations(top_k=2, pair_budget=4) # tiny budget forces several patron chunks
+        self.assertEqual(self.related(0), [(1, 2), (2, 1)])
+        self.assertEqual(self.related(3), [(0, 1)])
+        self.assertEqual(BookRecommendation.objects.filter(book=self.books[0]).count(), 2)
+
+    @override_settings(RECOMMENDATIONS_TOP_K=3)
+    def test_limit_validation(self):
+        self.borrow(0, 0, 1, 2, 3)
+        rebuild_recommendations()
+        url = f'/api/books/{self.books[0].pk}/related/'
+        self.assertEqual(len(APIClient().get(url, {'limit': 1}).json()), 1)
+        self.assertEqual(len(APIClient().get(url).json()), 3)
+        for limit in ['-1', '0', '4', 'x']:
+            self.assertEqual(APIClient().get(url, {'limit': limit}).status_code, 400, limit)
+
+    def test_blocked_build_matches_single_pass(self):
+        self.borrow(0, 0, 1, 2, 3)
+        self.borrow(1, 1, 2)
+        rebuild_recommendations()
+        expected = list(BookRecommendation.objects.order_by('book_id', 'rank').values_list('book_id', 'related_book_id', 'co_borrowers'))
+        rebuild_recommendations(block_size=1)
+        self.assertEqual(list(BookRecommendation.objects.order_by('book_id', 'rank').values_list('book_id', 'related_book_id', 'co_borrowers')), expected)
+
+    def test_incremental_update(self):
+        self.borrow(0, 0, 1)
+        rebuild_recommendations()
+        self.assertEqual(self.related(2), [])
+        self.borrow(1, 2, 1)
+        build = update_recommendations()
+        self.assertEqual(build.build_type, 'incremental')
+        self.assertEqual(self.related(2), [(1, 1)])
+        self.assertEqual(sorted(self.related(1)), [(0, 1), (2, 1)])
+
+
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.client.force_login(self.admin)
+        self.book = Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert')
+        self.loans = [Transaction.objects.create(user=self.admin, book=self.book, transaction_type='checkout') for _ in range(5)]
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/admin/core/transaction/')
+        self.assertEqual(response.status_code, 200)
+        Transaction.objects.create(user=self.admin, book=self.book, transaction_type='checkout')
+        with CaptureQueriesContext(connection) as ctx_more:
+            self.client.get('/admin/core/transaction/')
+        self.assertEqual(len(ctx.captured_queries), len(ctx_more.captured_queries))
+
+    def test_search_uses_exact_indexed_matches(self):
+        response = self.client.get('/admin/core/transaction/', {'q': '9780000000001'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+        response = self.client.get('/admin/core/transaction/', {'q': str(self.loans[0].pk)})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get('/admin/core/transaction/', {'q': 'Dun'}) # no icontains
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+
+class LoadTestInvariantTests(TestCase):
+    def setUp(self):
+        setup_fixtures(patrons=2, books=2)
+        self.patron = User.objects.get(username='loadtest-patron-0')
+        self.book = Book.objects.get(isbn='LT00000000000')
+
+    def test_clean_data_passes(self):
+        self.assertEqual(check_invariants(), {})
+
+    def test_double_checkout_and_missing_fee_are_reported(self):
+        Transaction.objects.create(user=self.patron, book=self.book, transaction_type='checkout')
+        Transaction.objects.create(user=self.patron, book=self.book, transaction_type='checkout')
+        Transaction.objects.create(user=self.patron, book=Book.objects.get(isbn='LT00000000001'), transaction_type='return',
+                                   due_date=timezone.localdate() - timedelta(days=5), return_date=timezone.now())
+        violations = check_invariants()
+        self.assertEqual(violations['book checked out more than once'], [self.book.pk])
+        self.assertIn('book available with an open loan', violations)
+        self.assertEqual(len(violations['overdue return without a fee']), 1)
+
+
+class PrebuiltSchemaTests(TestCase):
+    def test_schema_is_served_with_etag(self):
+        response = self.client.get('/openapi.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/books/{id}/related/', response.json()['paths'])
+        response = self.client.get('/openapi.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        revocation_list.reset()
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.client = APIClient()
+
+    def login(self, username='librarian'):
+        return self.client.post('/api/token/', {'username': username, 'password': 'password'}).json()
+
+    def get_users(self, access):
+        return self.client.get('/api/users/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_unrevoked_tokens_are_checked_without_queries(self):
+        tokens = self.login()
+        self.assertEqual(self.get_users(tokens['access']).status_code, 200) # Builds the filter
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.get_users(tokens['access']).status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'core_revokedtoken' in q['sql']])
+
+    def test_logout_revokes_refresh_and_access_token(self):
+        tokens = self.login()
+        response = self.client.post('/api/token/logout/', {'refresh': tokens['refresh']},
+                                    HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_users(tokens['access']).status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoke_all_for_user(self):
+        User.objects.create_superuser('assistant', 'assistant@library.local', 'password')
+        victim = self.login('assistant')
+        admin = self.login()
+        assistant = User.objects.get(username='assistant')
+        response = self.client.post(f'/api/users/{assistant.pk}/revoke-tokens/', HTTP_AUTHORIZATION=f"Bearer {admin['access']}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_users(victim['access']).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': victim['refresh']}).status_code, 401)
+        self.assertEqual(self.get_users(admin['access']).status_code, 200)
+
+    def test_refresh_picks_up_other_workers_and_rebuild_prunes(self):
+        tokens = self.login()
+        self.assertEqual(self.get_users(tokens['access']).status_code, 200)
+        access = AccessToken(tokens['access'])
+        # Written by another worker: invisible until this worker refreshes.
+        RevokedToken.objects.create(key=access['jti'], user=self.admin, expires_at=timezone.now() + timedelta(hours=1))
+        RevokedToken.objects.create(key='stale', expires_at=timezone.now() - timedelta(seconds=1))
+        revocation_list.refresh()
+        self.assertEqual(self.get_users(tokens['access']).status_code, 401)
+        revocation_list.rebuild()
+        self.assertFalse(RevokedToken.objects.filter(key='stale').exists())
+
+
+class IdempotencyKeyTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.book = Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert')
+
+    def checkout(self, key, results=None, book=None):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/transactions/checkout/', {
+            'user': self.admin.pk, 'book': str((book or self.book).pk), 'transaction_type': 'checkout',
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        if results is not None:
+            results.append(response)
+        return response
+
+    def checkout_in_thread(self, key, results):
+        def run():
+            try:
+                self.checkout(key, results)
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def start_blocked_checkout(self, key, results):
+        """Starts a checkout in a thread and returns once it is inside the view, holding the lock."""
+        entered, release = threading.Event(), threading.Event()
+        original_save = TransactionCreateSerializer.save
+
+        def slow_save(serializer, **kwargs):
+            entered.set()
+            release.wait(5)
+            return original_save(serializer, **kwargs)
+
+        patcher = mock.patch.object(TransactionCreateSerializer, 'save', slow_save)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        thread = self.checkout_in_thread(key, results)
+        self.assertTrue(entered.wait(5))
+        return thread, release
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_concurrent_duplicate_is_rejected_then_replayed(self):
+        first = []
+        thread, release = self.start_blocked_checkout('kiosk-1', first)
+        duplicate = self.checkout('kiosk-1')
+        self.assertEqual(duplicate.status_code, 409)
+        release.set()
+        thread.join(5)
+        self.assertEqual(first[0].status_code, 201)
+
+        retry = self.checkout('kiosk-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json()['id'], first[0].data['id'])
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=5)
+    def test_concurrent_duplicate_waits_for_first_response(self):
+        first, duplicates = [], []
+        thread, release = self.start_blocked_checkout('kiosk-2', first)
+        waiters = [self.checkout_in_thread('kiosk-2', duplicates) for _ in range(3)]
+        release.set()
+        for t in [thread, *waiters]:
+            t.join(10)
+        self.assertEqual([r.status_code for r in first + duplicates], [201] * 4)
+        self.assertEqual({str(r.data['id']) for r in first + duplicates}, {str(first[0].data['id'])})
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_reused_with_different_body(self):
+        other = Book.objects.create(isbn='9780000000002', title='Emma', authors='Jane Austen')
+        self.assertEqual(self.checkout('kiosk-3').status_code, 201)
+        self.assertEqual(self.checkout('kiosk-3', book=other).status_code, 422)
+
+    def test_mark_as_paid_retry_replays_success(self):
+        fee = Fee.objects.create(user=self.admin, book=self.book, amount='1.50')
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        responses = [client.post(f'/api/fees/{fee.pk}/mark-as-paid/', HTTP_IDEMPOTENCY_KEY='pay-1') for _ in range(2)]
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        # Without a key the old behaviour is unchanged.
+        self.assertEqual(client.post(f'/api/fees/{fee.pk}/mark-as-paid/').status_code, 400)
+
+
+class StocktakeTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        statuses = ['available', 'available', 'available', 'borrowed', 'lost']
+        self.books = [Book.objects.create(isbn=f'978000000000{i}', title=f'Book {i}', authors='A', status=status)
+                      for i, status in enumerate(statuses)]
+        self.stocktake_id = self.client.post('/api/stocktakes/', {'name': '2026'}).data['id']
+
+    def scan(self, isbns):
+        return self.client.post(f'/api/stocktakes/{self.stocktake_id}/scans/', {'isbns': isbns}, format='json')
+
+    def test_report_and_confirm(self):
+        self.assertEqual(self.scan(['978-0000000000', '9780000000001']).status_code, 201)
+        response = self.scan(['9780000000001', '9780000000003', '9780000000004', '9999999999999', 'not-an-isbn-at-all'])
+        self.assertEqual(response.data['rejected'], ['not-an-isbn-at-all'])
+        self.assertEqual(response.data['scan_count'], 6)
+
+        with self.assertNumQueries(10): # Fixed, however many scans there are
+            report = self.client.get(f'/api/stocktakes/{self.stocktake_id}/report/').data
+        self.assertEqual(report['distinct_isbns'], 5)
+        self.assertEqual([row['isbn'] for row in report['missing']['sample']], ['9780000000002'])
+        self.assertEqual(report['scanned_borrowed']['count'], 1)
+        self.assertEqual(report['scanned_lost']['count'], 1)
+        self.assertEqual(report['unknown']['sample'], ['9999999999999'])
+
+        stale = self.client.post(f'/api/stocktakes/{self.stocktake_id}/confirm/', {'expected_missing': 3})
+        self.assertEqual(stale.status_code, 409)
+        version = cache.get('catalog:version', 1)
+        response = self.client.post(f'/api/stocktakes/{self.stocktake_id}/confirm/', {'expected_missing': 1})
+        self.assertEqual(response.data['lost_count'], 1)
+        self.assertEqual(Book.objects.get(isbn='9780000000002').status, 'lost')
+        self.assertEqual(Book.objects.filter(status='available').count(), 2)
+        self.assertNotEqual(cache.get('catalog:version'), version)
+        self.assertEqual(self.scan(['9780000000002']).status_code, 409)
+
+
+@override_settings(ROSTER_INVITATION_URL='https://library.example/welcome')
+class RosterImportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        User.objects.create_user('s-old', 'old@school.test', 'password', user_type='student')
+        User.objects.create_user('s-keep', 'keep@school.test', 'password', user_type='student', first_name='Kim')
+
+    def upload(self, content, name='roster.csv', **options):
+        return self.client.post('/api/roster-imports/', {'file': SimpleUploadedFile(name, content), **options}, format='multipart')
+
+    def test_csv_upsert_and_deactivate_missing(self):
+        roster = (
+            "Username,Email,First Name,Last Name,User Type\n"
+            "s-keep,keep@school.test,Kimberly,Lee,\n"
+            + "".join(f"s-{i},s{i}@school.test,First{i},Last{i},student\n" for i in range(25))
+        ).encode()
+        response = self.upload(roster, deactivate_missing='true', send_invitations='true')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['created_count'], response.data['updated_count'], response.data['deactivated_count']), (25, 1, 1))
+        self.assertEqual(response.data['invitations_sent'], 25)
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertFalse(User.objects.get(username='s-old').is_active)
+        self.assertTrue(User.objects.get(username='librarian').is_active)
+        self.assertEqual(User.objects.get(username='s-keep').first_name, 'Kimberly')
+        self.assertFalse(User.objects.get(username='s-3').has_usable_password())
+        self.assertIn('https://library.example/welcome?uid=', mail.outbox[0].body)
+        self.assertFalse(RosterImportEntry.objects.exists())
+
+    @override_settings(ROSTER_INVITATION_URL='')
+    def test_invitations_need_a_configured_page(self):
+        response = self.upload(b"username,email\ns-new,new@school.test\n", send_invitations='true')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ROSTER_INVITATION_URL', str(response.data['send_invitations']))
+        self.assertFalse(User.objects.filter(username='s-new').exists())
+
+    def test_entries_are_pruned(self):
+        self.upload(b"username,email\ns-keep,keep@school.test\ns-new,new@school.test\n")
+        self.assertEqual(list(RosterImportEntry.objects.values_list('username', flat=True)), ['s-new']) # Kept for invitations
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=8)):
+            self.upload(b"username\ns-keep\n")
+        self.assertFalse(RosterImportEntry.objects.exists())
+
+    def test_invitation_sets_password_once(self):
+        self.upload(b"username,email\ns-new,new@school.test\n")
+        user = User.objects.get(username='s-new')
+        uid, token = invitation_token(user)
+        payload = {'uid': uid, 'token': token, 'password': 'correct horse battery'}
+        self.assertEqual(self.client.post('/api/users/accept-invitation/', payload).status_code, 204)
+        self.assertTrue(User.objects.get(username='s-new').check_password('correct horse battery'))
+        self.assertEqual(self.client.post('/api/users/accept-invitation/', payload).status_code, 400)
+
+    def test_invitations_last_and_can_be_resent(self):
+        self.upload(b"username,email\ns-new,new@school.test\ns-late,late@school.test\n", send_invitations='true')
+        user = User.objects.get(username='s-new')
+        uid, token = invitation_token(user)
+        payload = {'uid': uid, 'token': token, 'password': 'correct horse battery'}
+        with mock.patch('core.roster.InvitationTokenGenerator._now', return_value=datetime.now() + timedelta(days=31)):
+            self.assertEqual(self.client.post('/api/users/accept-invitation/', payload).status_code, 400)
+        with mock.patch('core.roster.InvitationTokenGenerator._now', return_value=datetime.now() + timedelta(days=10)):
+            self.assertEqual(self.client.post('/api/users/accept-invitation/', payload).status_code, 204)
+
+        mail.outbox.clear()
+        out = StringIO()
+        call_command('resend_invitations', stdout=out) # s-late only: s-new has a password, staff accounts have theirs
+        self.assertIn('Sent 1 invitation(s).', out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['late@school.test'])
+        call_command('resend_invitations', 's-new', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_row_errors_block_deactivation(self):
+        response = self.upload(b"username,email,user_type\ns-a,not-an-email,\ns-b,b@school.test,wizard\ns-c,c@school.test,\n",
+                               deactivate_missing='true')
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual([e['line'] for e in response.data['errors']], [2, 3])
+        self.assertEqual(response.data['deactivated_count'], 0)
+        self.assertTrue(User.objects.get(username='s-old').is_active)
+
+    def test_xlsx_and_command(self):
+        workbook = Workbook()
+        workbook.active.append(['username', 'email', 'user_type'])
+        for i in range(5):
+            workbook.active.append([f'x-{i}', f'x{i}@school.test', 'staff' if i == 0 else None])
+        path = os.path.join(tempfile.mkdtemp(), 'roster.xlsx')
+        workbook.save(path)
+        out = StringIO()
+        call_command('import_roster', path, '--batch-size', '2', stdout=out)
+        self.assertIn('5 created', out.getvalue())
+        self.assertEqual(User.objects.get(username='x-0').user_type, 'staff')
+        self.assertEqual(User.objects.filter(username__startswith='x-', user_type='student').count(), 4)
+
+
+class BarcodeTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password', first_name='Lin')
+        self.book = Book.objects.create(isbn='9780306406157', title='Dune', authors='Frank Herbert')
+        Book.objects.create(isbn='LT00000000001', title='Load test', authors='A', category='test')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(BARCODE_CACHE_DIR=cache_dir)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_book_barcode_is_rendered_once_and_revalidated(self):
+        with mock.patch.object(barcodes, 'render', wraps=barcodes.render) as render:
+            first = self.client.get(f'/api/books/{self.book.pk}/barcode/', HTTP_ACCEPT='image/svg+xml')
+            second = self.client.get(f'/api/books/{self.book.pk}/barcode/')
+            not_modified = self.client.get(f'/api/books/{self.book.pk}/barcode/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'image/svg+xml')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(barcodes.book_symbology(self.book)[0], 'isbn13')
+
+    def test_values_code128_cannot_encode(self):
+        jose = User.objects.create_user('josé', 'jose@library.local', 'password', first_name='José')
+        response = self.client.get(f'/api/users/{jose.pk}/barcode/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cannot be encoded', response.data['error'])
+        sheet = self.client.get('/api/users/barcode-sheet/')
+        self.assertEqual(sheet.status_code, 200)
+        self.assertEqual(sheet.content.count(b'class="label"'), 2)
+        self.assertEqual(sheet.content.count(b'class="unsupported"'), 1)
+        self.assertEqual(sheet.content.count(b'<img'), 1)
+
+    def test_user_barcode_and_sheet(self):
+        response = self.client.get(f'/api/users/{self.admin.pk}/barcode/')
+        self.assertEqual(response.status_code, 200)
+        sheet = self.client.get('/api/books/barcode-sheet/?category=test')
+        self.assertEqual(sheet.status_code, 200)
+        self.assertEqual(sheet.content.count(b'class="label"'), 1)
+        self.assertIn(b'Load test', sheet.content)
+        self.assertEqual(self.client.get('/api/books/barcode-sheet/?category=test', HTTP_IF_NONE_MATCH=sheet['ETag']).status_code, 304)
+        self.assertIn(b'Lin', self.client.get('/api/users/barcode-sheet/').content)
+
+    def test_png_barcodes(self):
+        for url in [f'/api/books/{self.book.pk}/barcode/?output=png', f'/api/users/{self.admin.pk}/barcode/?output=png']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertTrue(response.content.startswith(b'\x89PNG\r\n\x1a\n'))
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        svg = self.client.get(f'/api/books/{self.book.pk}/barcode/')
+        self.assertNotEqual(svg['ETag'], response['ETag'])
+
+    def test_png_without_pillow(self):
+        with mock.patch('barcode.writer.ImageWriter', None): # What python-barcode leaves when Pillow is missing
+            response = self.client.get(f'/api/books/{self.book.pk}/barcode/?output=png')
+        self.assertEqual(response.status_code, 406)
+        self.assertIn('Pillow', response.json()['error'])
+        self.assertEqual(self.client.get(f'/api/books/{self.book.pk}/barcode/').status_code, 200) # SVG still works
+
+
+class ConsistencyCheckTests(TestCase):
+    def setUp(self):
+        self.patron = User.objects.create_user('patron', 'patron@library.local', 'password')
+        self.ghost_loan = Book.objects.create(isbn='9780000000001', title='Borrowed, no loan', authors='A', status='borrowed')
+        self.unmarked = Book.objects.create(isbn='9780000000002', title='Available, on loan', authors='A')
+        Transaction.objects.create(user=self.patron, book=self.unmarked, transaction_type='checkout')
+        self.late = Transaction.objects.create(user=self.patron, book=Book.objects.create(isbn='9780000000003', title='Late', authors='A'),
+                                               transaction_type='return', due_date=timezone.localdate() - timedelta(days=4),
+                                               return_date=timezone.now())
+
+    def test_report_and_repair(self):
+        out = StringIO()
+        call_command('check_consistency', stdout=out)
+        self.assertIn('borrowed_without_open_loan: 1', out.getvalue())
+        self.assertIn('9780000000001', out.getvalue())
+        self.assertIn('available_with_open_loan: 1', out.getvalue())
+        self.assertIn('late_return_without_fee: 1', out.getvalue())
+        self.assertIn('several_open_loans: 0', out.getvalue())
+
+        call_command('check_consistency', '--repair', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(Book.objects.get(pk=self.ghost_loan.pk).status, 'available')
+        self.assertEqual(Book.objects.get(pk=self.unmarked.pk).status, 'borrowed')
+        self.assertEqual(Fee.objects.get(transaction=self.late).amount, Fee.overdue_amount(4))
+
+        out = StringIO()
+        call_command('check_consistency', '--repair', stdout=out)
+        self.assertIn('Nothing to repair.', out.getvalue())
+
+    def test_fee_created_concurrently_is_not_counted(self):
+        overdue_amount = Fee.overdue_amount
+
+        def return_races_repair(days):
+            # The loan's own return creates its fee after the repair selected it, before the insert.
+            Fee.objects.create(user=self.patron, book=self.late.book, transaction=self.late, amount=overdue_amount(days))
+            return overdue_amount(days)
+
+        with mock.patch.object(Fee, 'overdue_amount', side_effect=return_races_repair):
+            self.assertEqual(repair_inconsistencies(['late_return_without_fee']), {'late_return_without_fee': 0})
+        self.assertEqual(Fee.objects.filter(transaction=self.late).count(), 1)
+
+
+@override_settings(BOOK_COVER_WORKERS=0, BOOK_COVER_FETCHER='core.tests.fake_cover_fetcher')
+class CoverCacheTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.admin = User.objects.create_superuser('librarian', 'librarian@library.local', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_book(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Book.objects.create(isbn='9780000000001', title='Dune', authors='Frank Herbert', **fields)
+
+    def test_cover_url_is_ingested_with_thumbnails(self):
+        from PIL import Image
+
+        book = self.create_book(cover_image_url='https://covers.example/dune.jpg')
+        cover = BookCover.objects.get(book=book)
+        self.assertEqual(cover.status, 'ready')
+        for size in ['small', 'medium']:
+            with covers.default_storage.open(covers.thumbnail_path(cover.checksum, size)) as f:
+                self.assertLessEqual(max(Image.open(f).size), covers.cover_sizes()[size])
+
+        thumbnails = self.client.get(f'/api/books/{book.pk}/').data['cover_thumbnails']
+        self.assertEqual(set(thumbnails), {'small', 'medium', 'original'})
+        response = self.client.get(thumbnails['small'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(thumbnails['small'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_failed_fetch_and_missing_cover(self):
+        book = self.create_book(cover_image_url='https://covers.example/missing.jpg')
+        self.assertEqual(BookCover.objects.get(book=book).status, 'failed')
+        self.assertIsNone(self.client.get(f'/api/books/{book.pk}/').data['cover_thumbnails'])
+        self.assertEqual(self.client.get(f'/api/books/{book.pk}/cover/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/books/{book.pk}/cover/?size=huge').status_code, 400)
+
+    def test_upload(self):
+        book = self.create_book()
+        image, _ = fake_cover_fetcher('upload')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/books/{book.pk}/cover/', {
+                'file': SimpleUploadedFile('cover.jpg', image, content_type='image/jpeg'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(BookCover.objects.get(book=book).status, 'ready')
+        self.assertEqual(self.client.get(f'/api/books/{book.pk}/cover/?size=original').status_code, 200)
+
+        response = self.client.post(f'/api/books/{book.pk}/cover/', {'url': 'ftp://covers.example/x.jpg'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True): # Ordinary edits keep the uploaded cover
+            self.client.patch(f'/api/books/{book.pk}/', {'title': 'Dune (2nd ed.)'}, format='json')
+        self.assertEqual(BookCover.objects.get(book=book).source_url, '')
+
+    def test_upload_is_served_as_the_detected_type(self):
+        book = self.create_book()
+        image, _ = fake_cover_fetcher('upload')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/books/{book.pk}/cover/', {
+                'file': SimpleUploadedFile('cover.svg', image, content_type='image/svg+xml'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(f'/api/books/{book.pk}/cover/?size=original')['Content-Type'], 'image/jpeg')
+
+        response = self.client.post(f'/api/books/{book.pk}/cover/', {
+            'file': SimpleUploadedFile('cover.png', b'<svg onload="alert(1)"/>', content_type='image/png'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_private_addresses_are_refused(self):
+        book = self.create_book()
+        for url in ['http://localhost/x.jpg', 'http://10.0.0.1/x.jpg', 'http://[::ffff:169.254.169.254]/x.jpg']:
+            response = self.client.post(f'/api/books/{book.pk}/cover/', {'url': url}, format='json')
+            self.assertEqual(response.status_code, 400, url)
+        with mock.patch('socket.getaddrinfo', return_value=[(2, 1, 6, '', ('192.168.1.20', 80))]):
+            with self.assertRaisesRegex(covers.CoverError, 'not a public address'):
+                covers.fetch_url('http://intranet.example/x.jpg')
+
+    def test_redirects_to_private_addresses_are_refused(self):
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        class Redirect(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(302)
+                self.send_header('Location', 'http://169.254.169.254/latest/meta-data/')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Redirect)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        check_address = covers._check_address
+        test_server_allowed = lambda host, ip: None if ip == '127.0.0.1' else check_address(host, ip)
+        with mock.patch('core.covers._check_address', side_effect=test_server_allowed):
+            with self.assertRaisesRegex(covers.CoverError, '169.254.169.254'):
+                covers.fetch_url(f'http://127.0.0.1:{server.server_port}/cover.jpg')
+
+    def test_cover_replaced_while_job_runs(self):
+        book = self.create_book()
+        fetch = fake_cover_fetcher
+
+        def replaced_during_fetch(url):
+            if url.endswith('/old.jpg'):
+                covers.ingest_url(book, 'https://covers.example/new.jpg')
+            return fetch(url)
+
+        with mock.patch('core.tests.fake_cover_fetcher', side_effect=replaced_during_fetch), \
+                self.captureOnCommitCallbacks(execute=True):
+            covers.ingest_url(book, 'https://covers.example/old.jpg')
+        cover = BookCover.objects.get(book=book)
+        self.assertEqual((cover.source_url, cover.status), ('https://covers.example/new.jpg', 'ready'))
+        new_image, _ = fake_cover_fetcher('https://covers.example/new.jpg')
+        self.assertEqual(cover.checksum, hashlib.sha256(new_image).hexdigest())
+
+    def test_stale_pending_covers_are_found(self):
+        book = self.create_book()
+        covers.ingest_url(book, 'https://covers.example/lost.jpg') # Its on-commit job never runs
+        self.assertFalse(covers.stale_covers().exists())
+        BookCover.objects.filter(book=book).update(updated_at=timezone.now() - timedelta(minutes=31))
+        self.assertEqual(list(covers.stale_covers()), [BookCover.objects.get(book=book)])
+        self.assertEqual(covers.process_cover(book.pk).status, 'ready')
+        self.assertFalse(covers.stale_covers().exists())
+
+    def test_posted_url_survives_later_saves(self):
+        book = self.create_book(cover_image_url='https://covers.example/1.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/books/{book.pk}/cover/', {'url': 'https://covers.example/2.jpg'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Book.objects.get(pk=book.pk).cover_image_url, 'https://covers.example/2.jpg')
+
+        with mock.patch('core.tests.fake_cover_fetcher', wraps=fake_cover_fetcher) as fetcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/books/{book.pk}/', {'title': 'Dune (2nd ed.)'}, format='json')
+            self.assertEqual(fetcher.call_count, 0)
+            self.assertEqual(BookCover.objects.get(book=book).source_url, 'https://covers.example/2.jpg')
+
+            with self.captureOnCommitCallbacks(execute=True): # A new URL on the book is ingested again
+                self.client.patch(f'/api/books/{book.pk}/', {'cover_image_url': 'https://covers.example/3.jpg'}, format='json')
+            self.assertEqual(fetcher.call_count, 1)
+        self.assertEqual(BookCover.objects.get(book=book).source_url, 'https://covers.example/3.jpg')
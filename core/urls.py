@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, BookViewSet, TransactionViewSet, FeeViewSet
+from .views import UserViewSet, BookViewSet, TransactionViewSet, FeeViewSet, StocktakeViewSet, RosterImportViewSet
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
@@ -8,6 +8,8 @@ router.register(r'users', UserViewSet, basename='user')
 router.register(r'books', BookViewSet, basename='book')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
 router.register(r'fees', FeeViewSet, basename='fee')
+router.register(r'stocktakes', StocktakeViewSet, basename='stocktake')
+router.register(r'roster-imports', RosterImportViewSet, basename='roster-import')
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
@@ -0,0 +1,72 @@
+"""
+API documentation: the drf_yasg schema views and a prebuilt-schema endpoint.
+
+drf_yasg is imported lazily, so a deployment that serves only the prebuilt
+schema (see settings_production.py and `manage.py generate_schema`) never
+loads it at worker startup.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_GET
+
+_prebuilt = {}
+_prebuilt_lock = threading.Lock()
+
+
+def api_info():
+    from drf_yasg import openapi
+    return openapi.Info(
+        title="Library Management System API",
+        default_version='v1',
+        description="API documentation for the Library Management System",
+        terms_of_service="https://www.google.com/policies/terms/", # Replace with actual ToS URL
+        contact=openapi.Contact(email="contact@library.local"),    # Replace with actual contact
+        license=openapi.License(name="BSD License"),             # Replace with actual license
+    )
+
+
+def get_docs_schema_view():
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+    return get_schema_view(
+        api_info(),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+
+
+def generate_schema_json():
+    """Introspect every viewset once and return the OpenAPI document as JSON bytes."""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+    schema = OpenAPISchemaGenerator(api_info(), url=getattr(settings, 'API_SCHEMA_URL', None)).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def _load_prebuilt():
+    """The schema written at deploy time, or generated once per process if the file is missing."""
+    with _prebuilt_lock:
+        if not _prebuilt:
+            try:
+                content = settings.API_SCHEMA_FILE.read_bytes()
+            except OSError:
+                content = generate_schema_json()
+            _prebuilt['content'] = content
+            _prebuilt['etag'] = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+    return _prebuilt
+
+
+@require_GET
+def prebuilt_schema(request):
+    """Serve the prebuilt OpenAPI schema from memory with an ETag and long-lived caching."""
+    schema = _load_prebuilt()
+    if request.headers.get('If-None-Match') == schema['etag']:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(schema['content'], content_type='application/json')
+    response['ETag'] = schema['etag']
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'API_SCHEMA_CACHE_SECONDS', 3600)}"
+    return response
@@ -148,7 +148,7 @@ AUTH_USER_MODEL = "core.User"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.RevocationCheckingJWTAuthentication', # simplejwt's JWTAuthentication plus logout/revoke-all checks
         'rest_framework.authentication.SessionAuthentication', # Optional: for browsable API and session auth
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -165,7 +165,7 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), # Example: 1 hour
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
-    'BLACKLIST_AFTER_ROTATION': True,
+    'BLACKLIST_AFTER_ROTATION': True, # Enforced by core.revocation (token_blacklist app is not used)
     'UPDATE_LAST_LOGIN': True,
 
     'ALGORITHM': 'HS256',
@@ -187,6 +187,7 @@ SIMPLE_JWT = {
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
 
     'JTI_CLAIM': 'jti',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.RevocationCheckingTokenRefreshSerializer',
 
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5), # Not used if ROTATE_REFRESH_TOKENS is False
@@ -210,3 +211,84 @@ SWAGGER_SETTINGS = {
 REDOC_SETTINGS = {
     'LAZY_RENDERING': False,
 }
+
+# Transaction archival (see core/archive.py and `manage.py archive_transactions`)
+TRANSACTION_ARCHIVE_AFTER_DAYS = int(os.environ.get("TRANSACTION_ARCHIVE_AFTER_DAYS", "365"))
+TRANSACTION_ARCHIVE_BATCH_SIZE = int(os.environ.get("TRANSACTION_ARCHIVE_BATCH_SIZE", "1000"))
+
+# Email (loan reminders and overdue notices, see `manage.py send_loan_notices`)
+EMAIL_BACKEND = os.environ.get("DJANGO_EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+DEFAULT_FROM_EMAIL = os.environ.get("DJANGO_DEFAULT_FROM_EMAIL", "library@library.local")
+
+# Cache (facet counts, ...). Defaults to per-process memory; point at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+# Catalog facets on /api/books/ and /api/books/search/
+BOOK_FACET_LIMIT = 50 # Values returned per facet, most common first
+BOOK_FACETS_CACHE_TIMEOUT = 300
+
+# "Also borrowed" recommendations (see `manage.py build_recommendations`)
+RECOMMENDATIONS_TOP_K = 10
+RECOMMENDATIONS_MAX_BASKET = 200 # Most recent distinct books per patron that count towards co-borrowing
+RECOMMENDATIONS_PAIR_BUDGET = 20_000_000 # Book pairs expanded in memory at once (~16 bytes each)
+RECOMMENDATIONS_BLOCK_SIZE = 50_000 # Source books per pass; bounds the distinct-pair table (each pass rescans the baskets)
+
+# Admin changelists on large tables count exactly up to this many rows, then use planner estimates (PostgreSQL)
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# OpenAPI schema: written at deploy time by `manage.py generate_schema`, served from /openapi.json
+API_SCHEMA_FILE = BASE_DIR / "openapi.json"
+API_SCHEMA_URL = os.environ.get("API_SCHEMA_URL") # e.g. https://library.example.org; None uses relative URLs
+API_SCHEMA_CACHE_SECONDS = 3600 # Also used for the live Swagger/ReDoc views
+
+# JWT revocation (/api/token/logout/, /api/users/{id}/revoke-tokens/), checked against an in-memory Bloom filter (core/revocation.py)
+TOKEN_REVOCATION_REFRESH_SECONDS = 5 # How often each worker loads revocations made by other workers
+TOKEN_REVOCATION_REBUILD_SECONDS = 3600 # Prune expired rows and rebuild the filter
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100_000 # Grows automatically on rebuild if more tokens are revoked
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
+TOKEN_REVOCATION_LRU_SIZE = 4096
+
+# Idempotency-Key support on checkout, return and mark-as-paid (core/idempotency.py). Needs a shared CACHES backend across workers.
+IDEMPOTENCY_KEY_TTL = 24 * 3600 # How long a stored response is replayed
+IDEMPOTENCY_LOCK_TIMEOUT = 30 # In-flight lock expiry, in case a worker dies mid-request
+IDEMPOTENCY_WAIT_SECONDS = 2 # How long a concurrent duplicate waits for the first response before returning 409
+
+# Stocktake (/api/stocktakes/)
+STOCKTAKE_MAX_CHUNK = 10000 # Scanned ISBNs accepted per POST to /scans/
+STOCKTAKE_SAMPLE_SIZE = 50 # Rows listed per section of the report
+
+# Semester roster import (/api/roster-imports/, `manage.py import_roster`)
+ROSTER_IMPORT_BATCH_SIZE = 1000 # Rows upserted per bulk_create/bulk_update
+# Page of the patron-facing site where invited students choose a password: it receives ?uid=&token= and
+# POSTs them with the password to /api/users/accept-invitation/. Required for sending invitations.
+ROSTER_INVITATION_URL = os.environ.get("ROSTER_INVITATION_URL", "")
+ROSTER_INVITATION_TIMEOUT_DAYS = 30 # How long invitation links work; `manage.py resend_invitations` sends fresh ones
+ROSTER_ENTRY_RETENTION_DAYS = 7 # Usernames recorded per import are kept this long at most (see core/roster.py)
+
+# Barcode labels (/api/books/{id}/barcode/, /api/users/{id}/barcode/, .../barcode-sheet/)
+BARCODE_CACHE_DIR = Path(os.environ.get("BARCODE_CACHE_DIR", BASE_DIR / "cache" / "barcodes")) # Content-addressed; safe to delete
+BARCODE_MAX_AGE_SECONDS = 86400 # Browser caching; revalidated by ETag afterwards
+BARCODE_SHEET_MAX_LABELS = 1000
+
+# Consistency check between book status, open loans and overdue fees (`manage.py check_consistency`)
+CONSISTENCY_SAMPLE_SIZE = 20
+CONSISTENCY_REPAIR_BATCH_SIZE = 1000
+
+# Uploaded files (cover images, see core/covers.py)
+MEDIA_ROOT = Path(os.environ.get("DJANGO_MEDIA_ROOT", BASE_DIR / "media"))
+MEDIA_URL = "media/"
+
+# Cover cache (/api/books/{id}/cover/, `manage.py cache_covers`)
+BOOK_COVER_SIZES = {"small": 96, "medium": 320} # Longest side in pixels
+BOOK_COVER_WORKERS = int(os.environ.get("BOOK_COVER_WORKERS", "4")) # Thread pool for fetching and resizing; 0 runs jobs inline
+BOOK_COVER_FETCHER = "core.covers.fetch_url" # Dotted path to fetch(url) -> (bytes, content_type)
+BOOK_COVER_FETCH_TIMEOUT = 10
+BOOK_COVER_MAX_BYTES = 5 * 1024 * 1024
+BOOK_COVER_MAX_AGE_SECONDS = 300 # For cover URLs without the current ?v= checksum
+BOOK_COVER_STALE_MINUTES = 30 # Pending covers older than this lost their job; cache_covers re-queues them
@@ -0,0 +1,25 @@
+"""
+Production settings for library_system.
+
+Use with DJANGO_SETTINGS_MODULE=library_system.settings_production. Workers
+boot without the interactive docs (drf_yasg), crispy_forms or the browsable
+API renderer; the API schema is served prebuilt from /openapi.json (run
+`manage.py generate_schema` during deploy). Set DJANGO_ENABLE_ADMIN=False to
+leave the Django admin out of API-only workers as well.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, REST_FRAMEWORK, os
+
+DEBUG = os.environ.get("DJANGO_DEBUG", "False") == "True"
+
+_OPTIONAL_APPS = {"drf_yasg", "crispy_forms", "crispy_bootstrap5"}
+if os.environ.get("DJANGO_ENABLE_ADMIN", "True") != "True":
+    _OPTIONAL_APPS.add("django.contrib.admin")
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in _OPTIONAL_APPS]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',), # No browsable API templates
+}
@@ -1,36 +1,37 @@
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Library Management System API",
-      default_version='v1',
-      description="API documentation for the Library Management System",
-      terms_of_service="https://www.google.com/policies/terms/", # Replace with actual ToS URL
-      contact=openapi.Contact(email="contact@library.local"),    # Replace with actual contact
-      license=openapi.License(name="BSD License"),             # Replace with actual license
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from core.views import LogoutView
+from .api_docs import prebuilt_schema
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
     path('api/', include('core.urls')), # Include core app's API URLs
 
     # JWT Token endpoints
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/logout/', LogoutView.as_view(), name='token_logout'),
 
-    # API Documentation (Swagger UI and ReDoc)
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    # Prebuilt OpenAPI schema (generated at deploy time by `manage.py generate_schema`)
+    path('openapi.json', prebuilt_schema, name='schema-prebuilt'),
 ]
+
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path("admin/", admin.site.urls))
+
+# API Documentation (Swagger UI and ReDoc). Left out when drf_yasg is not installed, e.g. in settings_production.
+if 'drf_yasg' in settings.INSTALLED_APPS:
+    from .api_docs import get_docs_schema_view
+
+    schema_view = get_docs_schema_view()
+    urlpatterns += [
+        path('swagger<format>/', schema_view.without_ui(cache_timeout=settings.API_SCHEMA_CACHE_SECONDS), name='schema-json'),
+        path('swagger/', schema_view.with_ui('swagger', cache_timeout=settings.API_SCHEMA_CACHE_SECONDS), name='schema-swagger-ui'),
+        path('redoc/', schema_view.with_ui('redoc', cache_timeout=settings.API_SCHEMA_CACHE_SECONDS), name='schema-redoc'),
+    ]